@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+"""asyncio transport over the termios serial ports set up by SerialPort."""
+
+import asyncio
+import os
+
+import metrics
+from serialport import SerialPort
+
+
+class SerialTransport(asyncio.Transport):
+  """Drives a SerialPort's file descriptor with loop.add_reader/add_writer.
+
+  Writes go straight to the descriptor when nothing is queued, so a frame
+  normally costs a single write() with no loop round trip; anything the
+  kernel does not accept is queued until the descriptor is writable again.
+  """
+
+  max_read = 4096
+
+  def __init__(self, loop, port, protocol):
+    super().__init__({'port': port, 'tty_name': port.tty_name,
+                      'baudrate': port.baudrate})
+    self._loop = loop
+    self._port = port
+    self._fd = port.fileno()
+    self._protocol = protocol
+    self._buffer = bytearray()
+    self._closing = False
+    self._reading = True
+    os.set_blocking(self._fd, False)
+    loop.add_reader(self._fd, self._ReadReady)
+    loop.call_soon(protocol.connection_made, self)
+
+  def _ReadReady(self):
+    try:
+      data = os.read(self._fd, self.max_read)
+    except (BlockingIOError, InterruptedError):
+      return
+    except OSError as exc:
+      self._Fatal(exc)
+      return
+    if not data:
+      self._Fatal(ConnectionResetError('%s closed' % (self._port.tty_name,)))
+      return
+    if metrics.enabled:
+      metrics.BYTES_RECEIVED.Inc((self._port.tty_name,), len(data))
+    self._protocol.data_received(data)
+
+  def _WriteReady(self):
+    try:
+      written = os.write(self._fd, self._buffer)
+    except (BlockingIOError, InterruptedError):
+      return
+    except OSError as exc:
+      self._Fatal(exc)
+      return
+    del self._buffer[:written]
+    if not self._buffer:
+      self._loop.remove_writer(self._fd)
+      if self._closing:
+        self._CallConnectionLost(None)
+
+  def write(self, data):
+    if self._closing:
+      raise ConnectionError('write to closing transport')
+    if not data:
+      return
+    if metrics.enabled:
+      metrics.BYTES_SENT.Inc((self._port.tty_name,), len(data))
+    if not self._buffer:
+      try:
+        written = os.write(self._fd, data)
+      except (BlockingIOError, InterruptedError):
+        written = 0
+      except OSError as exc:
+        self._Fatal(exc)
+        return
+      if written == len(data):
+        return
+      data = memoryview(data)[written:]
+      self._loop.add_writer(self._fd, self._WriteReady)
+    self._buffer += data
+
+  def writelines(self, list_of_data):
+    self.write(b''.join(list_of_data))
+
+  def get_write_buffer_size(self):
+    return len(self._buffer)
+
+  def can_write_eof(self):
+    return False
+
+  def is_closing(self):
+    return self._closing
+
+  def is_reading(self):
+    return self._reading and not self._closing
+
+  def pause_reading(self):
+    if self._reading and not self._closing:
+      self._reading = False
+      self._loop.remove_reader(self._fd)
+
+  def resume_reading(self):
+    if not self._reading and not self._closing:
+      self._reading = True
+      self._loop.add_reader(self._fd, self._ReadReady)
+
+  def close(self):
+    if self._closing:
+      return
+    self._closing = True
+    self._loop.remove_reader(self._fd)
+    if not self._buffer:
+      self._loop.call_soon(self._CallConnectionLost, None)
+
+  def abort(self):
+    self._Fatal(None)
+
+  def _Fatal(self, exc):
+    self._closing = True
+    self._buffer.clear()
+    self._loop.remove_reader(self._fd)
+    self._loop.remove_writer(self._fd)
+    self._loop.call_soon(self._CallConnectionLost, exc)
+
+  def _CallConnectionLost(self, exc):
+    if self._port is None:
+      return
+    try:
+      self._protocol.connection_lost(exc)
+    finally:
+      self._port.Close()
+      self._port = None
+
+
+async def OpenSerialConnection(protocol_factory, tty_name, **kwargs):
+  """Open tty_name like loop.create_connection().
+
+  Returns (transport, protocol); keyword arguments go to SerialPort.
+  """
+  loop = asyncio.get_running_loop()
+  port = SerialPort(tty_name, **kwargs)
+  protocol = protocol_factory()
+  transport = SerialTransport(loop, port, protocol)
+  # Let connection_made() run before the caller starts writing.
+  await asyncio.sleep(0)
+  return transport, protocol
@@ -0,0 +1,205 @@
+#!/usr/bin/python3
+"""Benchmarks for the command table, the stream parser and the client.
+
+Usage: bench.py [micro|macro|all] [<output.json>]
+
+Results are written as JSON (to stdout by default) so runs from different
+releases can be compared. Micro benchmarks report the best of several
+timing runs in microseconds per operation; macro benchmarks run a client
+against the simulator on a pty and report commands per second and round
+trip latency percentiles in milliseconds.
+"""
+
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+
+import he100client
+from circles import CameraProtocol
+from he100 import HE100
+from simulator import HE100Model, Simulator
+
+REPEAT = 5
+STREAM_SIZES = (1024, 16384, 262144)
+PERCENTILES = (50, 90, 99)
+
+
+def _Args(frame, kind):
+  return tuple('0' * width if width else 'SIM' for width in frame.Widths(kind))
+
+
+def _Time(func, number):
+  """Return the best time of REPEAT runs of func, in us per call."""
+  best = min(timeit.repeat(func, number=number, repeat=REPEAT))
+  return best / number * 1e6
+
+
+def _Percentiles(samples):
+  samples = sorted(samples)
+  result = {}
+  for percentile in PERCENTILES:
+    index = min(len(samples) - 1, int(len(samples) * percentile / 100.0))
+    result['p%d' % percentile] = samples[index] * 1e3
+  result['mean'] = sum(samples) / len(samples) * 1e3
+  return result
+
+
+def BenchEncode(camera=HE100, number=200):
+  """Encode a control command for every controllable frame of the table."""
+  frames = [(frame, _Args(frame, 'control'))
+            for frame in camera.commands if frame.control_format]
+
+  def Text():
+    for frame, args in frames:
+      frame.EncodeControl(args)
+
+  def Bytes():
+    for frame, args in frames:
+      frame.EncodeControlBytes(args)
+
+  return {'frames': len(frames),
+          'encode_control_us': _Time(Text, number) / len(frames),
+          'encode_control_bytes_us': _Time(Bytes, number) / len(frames)}
+
+
+def BenchDecode(camera=HE100, number=200):
+  """Decode a reply for every frame of the table that has one.
+
+  Each reply is decoded by its own frame, as when the caller knows what it
+  asked, and through the table's dispatcher, as for unsolicited replies.
+  """
+  replies = [(frame, frame.EncodeReplyBytes(_Args(frame, 'reply')))
+             for frame in camera.commands if frame.reply_format]
+  texts = [(frame, reply.decode('latin-1')) for frame, reply in replies]
+  camera.GetDispatcher()
+
+  def Own():
+    for frame, text in texts:
+      frame.DecodeReply(text)
+
+  def Dispatched():
+    for _, reply in replies:
+      camera.DecodeReply(reply)
+
+  return {'frames': len(replies),
+          'decode_reply_us': _Time(Own, number) / len(replies),
+          'dispatch_reply_us': _Time(Dispatched, number) / len(replies)}
+
+
+def _Stream(size, camera=HE100):
+  """Return about size bytes of the frames a camera link carries."""
+  frames = []
+  for frame in camera.commands:
+    if frame.control_format:
+      frames.append(frame.EncodeControlBytes(_Args(frame, 'control')))
+    if frame.reply_format:
+      frames.append(frame.EncodeReplyBytes(_Args(frame, 'reply')))
+  frames.append(b'\x06')
+  chunk = b''.join(frames)
+  return (chunk * (size // len(chunk) + 1))[:size]
+
+
+def BenchParse(sizes=STREAM_SIZES, read_size=256):
+  """Split and display synthetic streams, fed read_size bytes at a time."""
+  results = {}
+  stdout = sys.stdout
+  with open(os.devnull, 'w') as devnull:
+    for size in sizes:
+      stream = _Stream(size)
+      chunks = [stream[i:i + read_size]
+                for i in range(0, len(stream), read_size)]
+      frames = []
+
+      def Parse():
+        protocol = CameraProtocol()
+        del frames[:]
+        for chunk in chunks:
+          frames.extend(protocol.DisplayCommands(chunk))
+
+      sys.stdout = devnull
+      try:
+        elapsed = _Time(Parse, 1) / 1e6
+      finally:
+        sys.stdout = stdout
+      results[str(size)] = {'frames': len(frames),
+                            'mb_per_s': size / elapsed / 1e6,
+                            'frames_per_s': len(frames) / elapsed}
+  return results
+
+
+async def _Loopback(tty_name, count, window):
+  client = await he100client.Connect(tty_name, window=window)
+  try:
+    frame = client.Resolve('pan/tilt position', 'confirm')
+    await client.Confirm(frame)  # Warm up the dispatcher and the simulator.
+
+    # Round trips are timed one command at a time, so they do not include
+    # waiting behind other commands.
+    latencies = []
+    for _ in range(count):
+      start = time.monotonic()
+      await client.Confirm(frame)
+      latencies.append(time.monotonic() - start)
+
+    # Throughput keeps the window full of different queries, as identical
+    # queued ones would be merged into one by the client's scheduler.
+    readable = [frame for frame in client.camera.commands
+                if frame.confirm_format and frame.reply_format]
+    frames = [readable[i % len(readable)] for i in range(count)]
+    start = time.monotonic()
+    for i in range(0, count, len(readable)):
+      await asyncio.gather(*[client.Confirm(frame)
+                             for frame in frames[i:i + len(readable)]])
+    elapsed = time.monotonic() - start
+  finally:
+    client.Close()
+  result = {'commands': count, 'commands_per_s': count / elapsed}
+  result.update(('rtt_%s_ms' % name, value)
+                for name, value in _Percentiles(latencies).items())
+  return result
+
+
+def BenchLoopback(count=200, windows=(1, 8), baudrate=9600, delay=0.005):
+  """Query a simulated camera over a pty, windows commands in flight."""
+  results = {'baudrate': baudrate, 'delay_ms': delay * 1e3}
+  for window in windows:
+    with Simulator(HE100Model(), baudrate, delay) as simulator:
+      results['window_%d' % window] = asyncio.run(
+          _Loopback(simulator.tty_name, count, window))
+  return results
+
+
+def Run(which='all'):
+  results = {'python': platform.python_version(),
+             'platform': platform.platform(),
+             'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+             'benchmarks': {}}
+  benchmarks = results['benchmarks']
+  if which in ('micro', 'all'):
+    benchmarks['encode'] = BenchEncode()
+    benchmarks['decode'] = BenchDecode()
+    benchmarks['parse'] = BenchParse()
+  if which in ('macro', 'all'):
+    benchmarks['loopback'] = BenchLoopback()
+  return results
+
+
+def main():
+  which = sys.argv[1] if len(sys.argv) > 1 else 'all'
+  if which not in ('micro', 'macro', 'all'):
+    print(__doc__.strip())
+    sys.exit(1)
+  output = json.dumps(Run(which), indent=2, sort_keys=True)
+  if len(sys.argv) > 2:
+    with open(sys.argv[2], 'w') as f:
+      f.write(output + '\n')
+  else:
+    print(output)
+
+
+if __name__ == '__main__':
+  main()
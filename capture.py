@@ -0,0 +1,246 @@
+#!/usr/bin/python
+"""Record everything seen on a camera link, and inspect or replay it later.
+
+Usage: capture.py record <tty> <file> [<baudrate>]
+       capture.py show <file> [<opcode> ...]
+       capture.py replay <file> <tty> [<speed> [<baudrate>]]
+
+A capture is a 16 byte header (magic and the wall clock time at the start)
+followed by one record per chunk read: a 13 byte little endian header of
+nanoseconds since the start on the monotonic clock, direction and length,
+then the bytes exactly as read. Nothing is parsed while recording.
+"""
+
+from __future__ import print_function
+
+import bisect
+import collections
+import mmap
+import os
+import struct
+import sys
+import time
+
+from framing import CCPFrame, PTFrame, StreamParser
+from serialport import SerialPort
+
+_Now = getattr(time, 'monotonic', time.time)
+
+MAGIC = b'PNCAP1\0\0'
+FILE_HEADER = struct.Struct('<8sd')
+RECORD_HEADER = struct.Struct('<QBI')
+
+RX, TX = 0, 1
+
+Record = collections.namedtuple('Record', 'time direction data')
+
+
+class CaptureWriter(object):
+  """Appends timestamped chunks to a capture file.
+
+  Records are gathered in memory and written with one system call once
+  buffer_size bytes are waiting or flush_interval seconds have passed since
+  the last write, so a crash loses at most that much.
+  """
+
+  def __init__(self, path, buffer_size=65536, flush_interval=1.0,
+               clock=_Now):
+    self.buffer_size = buffer_size
+    self.flush_interval = flush_interval
+    self.clock = clock
+    self.records = 0
+    self.bytes = 0
+    self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    self._start = clock()
+    self._flushed = self._start
+    self._buffer = bytearray(FILE_HEADER.pack(MAGIC, time.time()))
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.Close()
+
+  def Add(self, data, direction=RX):
+    """Record a chunk of data read from (or, with TX, written to) the link."""
+    now = self.clock()
+    self._buffer += RECORD_HEADER.pack(int((now - self._start) * 1e9),
+                                       direction, len(data))
+    self._buffer += data
+    self.records += 1
+    self.bytes += len(data)
+    if (len(self._buffer) >= self.buffer_size or
+        now - self._flushed >= self.flush_interval):
+      self.Flush()
+
+  def Flush(self):
+    data = memoryview(self._buffer)
+    while data:
+      written = os.write(self._fd, data)
+      data = data[written:]
+    del data
+    del self._buffer[:]
+    self._flushed = self.clock()
+
+  def Close(self):
+    if self._fd is None:
+      return
+    self.Flush()
+    os.close(self._fd)
+    self._fd = None
+
+
+class CaptureReader(object):
+  """Reads a capture through mmap, with an index of record offsets by time.
+
+  The index holds only the time and offset of each record and is built by
+  walking the record headers once; record data is sliced out of the map
+  when asked for. A capture cut short by a crash is read up to its last
+  complete record.
+  """
+
+  def __init__(self, path):
+    with open(path, 'rb') as f:
+      size = os.fstat(f.fileno()).st_size
+      if size < FILE_HEADER.size:
+        raise ValueError('%s is not a capture' % (path,))
+      self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, self.started = FILE_HEADER.unpack_from(self._map, 0)
+    if magic != MAGIC:
+      self.Close()
+      raise ValueError('%s is not a capture' % (path,))
+    self.times = []
+    self.offsets = []
+    self._Index()
+
+  def _Index(self):
+    offset, end = FILE_HEADER.size, len(self._map)
+    unpack = RECORD_HEADER.unpack_from
+    times, offsets = self.times, self.offsets
+    while offset + RECORD_HEADER.size <= end:
+      nanoseconds, _, length = unpack(self._map, offset)
+      if offset + RECORD_HEADER.size + length > end:
+        break
+      times.append(nanoseconds / 1e9)
+      offsets.append(offset)
+      offset += RECORD_HEADER.size + length
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.Close()
+
+  def __len__(self):
+    return len(self.offsets)
+
+  def __getitem__(self, index):
+    offset = self.offsets[index]
+    nanoseconds, direction, length = RECORD_HEADER.unpack_from(self._map,
+                                                               offset)
+    start = offset + RECORD_HEADER.size
+    return Record(nanoseconds / 1e9, direction,
+                  self._map[start:start + length])
+
+  @property
+  def duration(self):
+    return self.times[-1] if self.times else 0.0
+
+  def Seek(self, when):
+    """Return the index of the first record at or after when seconds."""
+    return bisect.bisect_left(self.times, when)
+
+  def Records(self, start=None, end=None, direction=None):
+    """Yield the records from start to end seconds, of one direction."""
+    first = 0 if start is None else self.Seek(start)
+    last = len(self) if end is None else bisect.bisect_right(self.times, end)
+    for index in range(first, last):
+      record = self[index]
+      if direction is None or record.direction == direction:
+        yield record
+
+  def Frames(self, start=None, end=None, direction=RX, opcodes=None,
+             **parser_args):
+    """Yield (time, frame) for the frames in the records of one direction.
+
+    A frame is stamped with the time of the record that completed it. With
+    opcodes, only frames whose payload starts with one of them (such as
+    b'OSD:4B' or b'#P') are yielded. Parsing starts at the first record
+    from start, so a frame cut by it comes out as noise.
+    """
+    if opcodes is not None:
+      opcodes = tuple(opcode if isinstance(opcode, bytes) else
+                      opcode.encode('latin-1') for opcode in opcodes)
+    parser = StreamParser(**parser_args)
+    for record in self.Records(start, end, direction):
+      for frame in parser.Feed(record.data):
+        if opcodes is None or (isinstance(frame, (CCPFrame, PTFrame)) and
+                               frame.payload.startswith(opcodes)):
+          yield record.time, frame
+
+  def Close(self):
+    if self._map is not None:
+      self._map.close()
+      self._map = None
+
+
+def Replay(reader, port, speed=1.0, start=None, end=None, direction=RX,
+           clock=_Now, sleep=time.sleep):
+  """Write the records of a capture to port at their original pace.
+
+  speed scales the pace (2.0 replays twice as fast); 0 writes everything
+  as fast as the port takes it. Each record is due at its capture time
+  relative to the first, so time spent writing does not add up.
+  """
+  origin = begun = None
+  for record in reader.Records(start, end, direction):
+    if origin is None:
+      origin, begun = record.time, clock()
+    if speed:
+      delay = begun + (record.time - origin) / speed - clock()
+      if delay > 0:
+        sleep(delay)
+    port.WriteFrame(record.data)
+
+
+def RecordPort(tty_name, path, baudrate=9600):
+  """Capture everything received on tty_name until interrupted."""
+  port = SerialPort(tty_name, baudrate)
+  with CaptureWriter(path) as writer:
+    try:
+      while True:
+        data = port.Read(timeout=writer.flush_interval)
+        if data:
+          writer.Add(data)
+        elif writer.records:
+          writer.Flush()
+    except KeyboardInterrupt:
+      pass
+  port.Close()
+  print('%d bytes in %d reads' % (writer.bytes, writer.records))
+
+
+def main():
+  if len(sys.argv) < 3 or sys.argv[1] not in ('record', 'show', 'replay'):
+    print(__doc__.strip())
+    sys.exit(1)
+  command = sys.argv[1]
+  if command == 'record':
+    baudrate = int(sys.argv[4]) if len(sys.argv) > 4 else 9600
+    RecordPort(sys.argv[2], sys.argv[3], baudrate)
+  elif command == 'show':
+    opcodes = sys.argv[3:] or None
+    with CaptureReader(sys.argv[2]) as reader:
+      for when, frame in reader.Frames(opcodes=opcodes):
+        print('%10.6f %-8s %r' % (when, type(frame).__name__, frame.raw))
+  else:
+    speed = float(sys.argv[4]) if len(sys.argv) > 4 else 1.0
+    baudrate = int(sys.argv[5]) if len(sys.argv) > 5 else 9600
+    port = SerialPort(sys.argv[3], baudrate)
+    with CaptureReader(sys.argv[2]) as reader:
+      Replay(reader, port, speed)
+    port.Close()
+
+
+if __name__ == '__main__':
+  main()
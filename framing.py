@@ -0,0 +1,184 @@
+#!/usr/bin/python
+"""Incremental parser for the CCP and PT framing used on the RS422 link."""
+
+STX = b'\x02'
+ETX = b'\x03'
+ACK = b'\x06'
+CR = b'\r'
+
+
+class Frame(object):
+  """A complete frame as seen on the wire, including its framing bytes."""
+  __slots__ = ('raw',)
+
+  def __init__(self, raw):
+    self.raw = raw
+
+  @property
+  def payload(self):
+    return self.raw
+
+  def __eq__(self, other):
+    return type(self) is type(other) and self.raw == other.raw
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __hash__(self):
+    return hash((type(self), self.raw))
+
+  def __repr__(self):
+    return '%s(%r)' % (type(self).__name__, self.raw)
+
+
+class CCPFrame(Frame):
+  """STX, camera command, ETX."""
+  __slots__ = ()
+
+  @property
+  def payload(self):
+    return self.raw[1:-1]
+
+
+class PTFrame(Frame):
+  """Pan/tilt command or reply terminated by CR."""
+  __slots__ = ()
+
+  @property
+  def payload(self):
+    return self.raw[:-1]
+
+
+class Ack(Frame):
+  """A bare ACK byte."""
+  __slots__ = ()
+
+  @property
+  def payload(self):
+    return self.raw[:0]
+
+
+class Noise(Frame):
+  """A run of bytes that could not be part of any frame."""
+  __slots__ = ()
+
+
+class StreamParser(object):
+  """Splits a byte stream into frames, accepting chunks of any size.
+
+  Input is copied once into a fixed size bytearray; frames are located with
+  bytearray.find() and each complete frame is copied out once. The unconsumed
+  tail is moved back to the start of the buffer when the buffer wraps, which
+  is never more than max_frame bytes.
+
+  pt_start restricts which bytes may open a PT frame, b'#' only accepts
+  commands as sent by a controller. By default any printable byte does, so
+  camera replies ('gz555', 'p1') are recognised as well.
+  """
+
+  def __init__(self, size=4096, max_frame=256, pt_start=None, noise=False):
+    if max_frame > size:
+      raise ValueError('max_frame larger than buffer')
+    self.size = size
+    self.max_frame = max_frame
+    self.noise = noise
+    self.discarded = 0
+    if pt_start is None:
+      pt_start = bytearray(range(0x21, 0x7F))
+    self._stx = ord(STX)
+    self._ack = ord(ACK)
+    self._pt_start = frozenset(bytearray(pt_start))
+    self._buffer = bytearray(size)
+    self._view = memoryview(self._buffer)
+    self._head = 0
+    self._tail = 0
+
+  def __len__(self):
+    """Number of buffered bytes not yet returned as frames."""
+    return self._tail - self._head
+
+  def Reset(self):
+    self._head = self._tail = 0
+
+  def Feed(self, data):
+    """Add data to the stream and return the list of frames it completed."""
+    frames = []
+    data = memoryview(data)
+    offset = 0
+    while offset < len(data):
+      if self._head == self._tail:
+        self._head = self._tail = 0
+      elif self._tail == self.size:
+        self._Compact()
+      count = min(len(data) - offset, self.size - self._tail)
+      self._view[self._tail:self._tail + count] = data[offset:offset + count]
+      self._tail += count
+      offset += count
+      self._Parse(frames)
+    return frames
+
+  def _Compact(self):
+    count = self._tail - self._head
+    self._buffer[:count] = self._buffer[self._head:self._tail]
+    self._head = 0
+    self._tail = count
+
+  def _Emit(self, frames, frame_type, start, end):
+    frames.append(frame_type(self._view[start:end].tobytes()))
+    self._head = end
+
+  def _Discard(self, frames, end):
+    self.discarded += end - self._head
+    if self.noise:
+      frames.append(Noise(self._view[self._head:end].tobytes()))
+    self._head = end
+
+  def _Parse(self, frames):
+    buf = self._buffer
+    tail = self._tail
+    pt_start = self._pt_start
+    noise_start = None
+    while self._head < tail:
+      head = self._head
+      lead = buf[head]
+      if lead == self._ack:
+        frame_type, term = Ack, None
+      elif lead == self._stx:
+        frame_type, term = CCPFrame, ETX
+      elif lead in pt_start:
+        frame_type, term = PTFrame, CR
+      else:
+        if noise_start is None:
+          noise_start = head
+        self._head = head + 1
+        continue
+
+      if noise_start is not None:
+        self._head = noise_start
+        self._Discard(frames, head)
+        noise_start = None
+
+      if term is None:
+        self._Emit(frames, frame_type, head, head + 1)
+        continue
+
+      limit = min(tail, head + self.max_frame)
+      end = buf.find(term, head + 1, limit)
+      # A new STX before the terminator means the frame was truncated,
+      # except as the checksum byte right before a PT frame's CR.
+      stop = limit if end < 0 else end
+      if frame_type is PTFrame:
+        stop -= 1
+      restart = buf.find(STX, head + 1, stop)
+      if restart >= 0:
+        self._Discard(frames, restart)
+      elif end >= 0:
+        self._Emit(frames, frame_type, head, end + 1)
+      elif limit - head >= self.max_frame:
+        self._Discard(frames, head + 1)
+      else:
+        break
+
+    if noise_start is not None:
+      self._head = noise_start
+      self._Discard(frames, tail)
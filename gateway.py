@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+"""Share one camera serial port between many network clients.
+
+Usage: gateway.py <tty> [<tcp port> [<udp port>]]
+
+Clients send the same CCP and PT frames they would write to the serial port,
+over TCP or as UDP datagrams, and get back the camera's replies to their own
+commands plus every unsolicited reply, such as preset complete notices.
+"""
+
+import asyncio
+import collections
+import sys
+import time
+
+import he100client
+from framing import Ack, CCPFrame, StreamParser
+
+UDP_IDLE = 60.0
+
+
+def _EncodeReply(frame, args):
+  """Re-encode decoded reply args, dropping any checksum group."""
+  return frame.EncodeReplyBytes(args[:len(frame.Widths())])
+
+
+class _Session(object):
+  """One remote client: its commands waiting for a turn and its replies."""
+
+  def __init__(self, gateway, name, write):
+    self.gateway = gateway
+    self.name = name
+    self.write = write
+    self.queue = collections.deque()
+    self.closed = False
+    self.seen = time.monotonic()
+    self._parser = StreamParser()
+
+  def Feed(self, data):
+    self.seen = time.monotonic()
+    for frame in self._parser.Feed(data):
+      if not isinstance(frame, Ack):
+        self.gateway._Queue(self, frame)
+
+  def Reply(self, data):
+    if not self.closed:
+      self.write(data)
+
+
+class _TCPProtocol(asyncio.Protocol):
+
+  def __init__(self, gateway):
+    self.gateway = gateway
+    self.session = None
+
+  def connection_made(self, transport):
+    self.session = self.gateway._Open(transport.get_extra_info('peername'),
+                                      transport.write)
+
+  def data_received(self, data):
+    self.session.Feed(data)
+
+  def connection_lost(self, exc):
+    self.gateway._Close(self.session)
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+  """Each source address is a session, forgotten after UDP_IDLE seconds."""
+
+  def __init__(self, gateway):
+    self.gateway = gateway
+    self.transport = None
+    self.sessions = {}
+
+  def connection_made(self, transport):
+    self.transport = transport
+
+  def datagram_received(self, data, addr):
+    session = self.sessions.get(addr)
+    if session is None:
+      self._Prune()
+      session = self.sessions[addr] = self.gateway._Open(
+          addr, lambda reply: self.transport.sendto(reply, addr))
+    session.Feed(data)
+
+  def _Prune(self):
+    idle = time.monotonic() - UDP_IDLE
+    for addr, session in list(self.sessions.items()):
+      if session.seen < idle and not session.queue:
+        self.gateway._Close(session)
+        del self.sessions[addr]
+
+
+class Gateway(object):
+  """Forwards frames from many sessions to one HE100Client.
+
+  Commands are decoded with the client's command table and handed to the
+  client round robin, one per session with work at a time, with at most
+  max_inflight outstanding, so a busy client cannot starve the others; the
+  client's scheduler then puts stops and speeds first and merges superseded
+  ones. Each reply goes back to the session whose command it answers, and
+  replies nobody asked for to every session. Commands the table does not
+  know are answered with ER3 if they are CCP frames and dropped otherwise.
+  """
+
+  def __init__(self, client, max_inflight=8):
+    self.client = client
+    self.max_inflight = max_inflight
+    self.sessions = set()
+    self.forwarded = 0
+    self.rejected = 0
+    self.servers = []
+    self._control = client.camera.GetDispatcher('control')
+    self._confirm = client.camera.GetDispatcher('confirm')
+    self._error = client.camera.Find('error 3')
+    self._active = collections.deque()
+    self._ready = asyncio.Event()
+    self._slots = asyncio.Semaphore(max_inflight)
+    self._feeder = asyncio.ensure_future(self._Feed())
+    client.AddListener(self._Broadcast)
+
+  async def Serve(self, host='127.0.0.1', port=0, udp_port=None):
+    """Listen on TCP port (and UDP udp_port); returns the bound TCP port."""
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: _TCPProtocol(self), host, port)
+    self.servers.append(server)
+    if udp_port is not None:
+      transport, _ = await loop.create_datagram_endpoint(
+          lambda: _UDPProtocol(self), local_addr=(host, udp_port))
+      self.servers.append(transport)
+    return server.sockets[0].getsockname()[1]
+
+  def _Open(self, name, write):
+    session = _Session(self, name, write)
+    self.sessions.add(session)
+    return session
+
+  def _Close(self, session):
+    session.closed = True
+    session.queue.clear()
+    self.sessions.discard(session)
+    try:
+      self._active.remove(session)
+    except ValueError:
+      pass
+
+  def _Queue(self, session, frame):
+    try:
+      command, _ = self._control.Decode(frame.raw)
+    except ValueError:
+      try:
+        command, _ = self._confirm.Decode(frame.raw)
+      except ValueError:
+        self.rejected += 1
+        if isinstance(frame, CCPFrame):
+          session.Reply(self._error.EncodeReplyBytes(
+              frame.payload[:3].ljust(3)))
+        return
+    if not session.queue:
+      self._active.append(session)
+    session.queue.append((command, frame.raw))
+    self._ready.set()
+
+  async def _Feed(self):
+    while True:
+      await self._slots.acquire()
+      while not self._active:
+        self._ready.clear()
+        await self._ready.wait()
+      session = self._active.popleft()
+      if session.closed or not session.queue:
+        self._slots.release()
+        continue
+      command, data = session.queue.popleft()
+      if session.queue:
+        self._active.append(session)
+      self.forwarded += 1
+      asyncio.ensure_future(self._Forward(session, command, data))
+
+  async def _Forward(self, session, command, data):
+    holding = bool(command.reply_format)
+    if not holding:
+      # The client merges queued commands without replies per frame, so
+      # they cannot pile up and need not hold a slot until written.
+      self._slots.release()
+    try:
+      args = await self.client.Send(command, data)
+    except he100client.CameraError as exc:
+      session.Reply(self._error.EncodeReplyBytes(exc.code))
+    except (asyncio.TimeoutError, ConnectionError):
+      pass  # As from the camera itself, no answer.
+    else:
+      if args is not None:
+        session.Reply(_EncodeReply(command, args))
+    finally:
+      if holding:
+        self._slots.release()
+
+  def _Broadcast(self, frame, args):
+    data = _EncodeReply(frame, args)
+    for session in list(self.sessions):
+      session.Reply(data)
+
+  async def Close(self):
+    self.client.RemoveListener(self._Broadcast)
+    self._feeder.cancel()
+    for server in self.servers:
+      server.close()
+    for session in list(self.sessions):
+      self._Close(session)
+    self.servers = []
+
+
+async def _Main(tty_name, port, udp_port):
+  client = await he100client.Connect(tty_name)
+  gateway = Gateway(client)
+  try:
+    port = await gateway.Serve('0.0.0.0', port, udp_port)
+    print('Serving %s on port %d' % (tty_name, port))
+    await asyncio.Event().wait()
+  finally:
+    await gateway.Close()
+    client.Close()
+
+
+def main():
+  if len(sys.argv) < 2:
+    print(__doc__.strip())
+    sys.exit(1)
+  port = int(sys.argv[2]) if len(sys.argv) > 2 else 4100
+  udp_port = int(sys.argv[3]) if len(sys.argv) > 3 else None
+  try:
+    asyncio.run(_Main(sys.argv[1], port, udp_port))
+  except KeyboardInterrupt:
+    pass
+
+
+if __name__ == '__main__':
+  main()
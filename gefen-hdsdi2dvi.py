@@ -1,101 +1,36 @@
 #!/usr/bin/python
+"""Set the frame format and output of a Gefen HD-SDI to DVI converter.
 
-import fcntl
-import struct
-import sys
-import termios
-import time
-import math
-import os
-
-class SerialPort(object):
-  def __init__(self, tty_name):
-    self.tty_name = tty_name
-    self.tty = None
-    self.old_termios = None
-    self.InitTTY()
-
-  def __del__(self):
-    if self.tty and self.old_termios:
-      fd = self.tty.fileno()
-      termios.tcsetattr(fd, termios.TCSAFLUSH, self.old_termios)
-
-  def InitTTY(self):
-    #self.tty = open(self.tty_name, 'rb+', 0)
-
-    #fd = open("/dev/ttyUSB0", O_RDWR | O_NOCTTY | O_NONBLOCK);
-    #fcntl(fd, F_SETFL, 0);
-    ttyfd = os.open(self.tty_name, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
-    fcntl.fcntl(ttyfd, fcntl.F_SETFL, 0)
-    self.tty = os.fdopen(ttyfd, 'rb+', 0)
-
-    fd = self.tty.fileno()
-
-    self.old_termios = termios.tcgetattr(fd)
-    new_termios = [termios.IGNPAR,                 # iflag
-                   0,                              # oflag
-                   termios.B115200 | termios.CS8 |
-                   termios.CLOCAL | termios.CREAD, # cflag
-                   0,                              # lflag
-                   termios.B115200,                  # ispeed
-                   termios.B115200,                  # ospeed
-                   self.old_termios[6]             # special characters
-                  ]
-    termios.tcsetattr(fd, termios.TCSANOW, new_termios)
+Usage: gefen-hdsdi2dvi.py [<tty> [<frame> [<output>]]]
+"""
 
-    #fcntl.ioctl(self.fd, termios.TIOCMBIS, TIOCM_RTS_str)
-    #control = fcntl.ioctl(fd, termios.TIOCMGET, struct.pack('I', 0))
-    #print '%04X' % struct.unpack('I',control)[0]
-    #fcntl.ioctl(fd, termios.TIOCMBIC, struct.pack('I', termios.TIOCM_RTS))
-    #fcntl.ioctl(fd, termios.TIOCMBIC, struct.pack('I', termios.TIOCM_DTR))
-    #control = fcntl.ioctl(fd, termios.TIOCMGET, struct.pack('I', 0))
-    #print '%04X' % struct.unpack('I',control)[0]
+from __future__ import print_function
 
-  def ReadByte(self):
-    return self.tty.read(1)
-
-  def WriteByte(self, byte):
-    return self.tty.write(byte)
-    pass
+import sys
 
+from gefen import GefenConverter, GefenError
+from serialport import ReadTimeout
 
 
 def main():
-  input_buffer = []
+  tty_name = sys.argv[1] if len(sys.argv) > 1 else '/dev/ttyS0'
+  frame = sys.argv[2] if len(sys.argv) > 2 else '8'
+  output = sys.argv[3] if len(sys.argv) > 3 else '8'
 
+  converter = GefenConverter(tty_name)
   try:
-    tty_name = sys.argv[1]
-  except IndexError:
-    tty_name = '/dev/ttyS0'
-
-  port = SerialPort(tty_name)
-
-  for i in "\r\r\r":
-    port.WriteByte(i)
-
-  for s in ["#FRAME 8\r","#OUTPUT 8\r"]: #LIST\r",]: #"#DEVTYPE\r","#DEVERSION\r",'#LIST\r',"#OUTPUT_8\r",]:
-    for i in s:
-      port.WriteByte(i)
-  
-    print "Wrote %r\nWaiting for response!" % (s,)
-  
-    response = False
-    while True:
-      r = ['']
-      while r[-1] != '\r':
-        r.append(port.ReadByte())
-        #sys.stdout.write(repr(r[-1]))
-        #sys.stdout.flush()
-      if "".join(r).strip() != "":
-        print "Response %r" % ("".join(r),)
-        response = True
-        break
-      else:
-        print "Empty"
-        if response:
-          break
+    replies = converter.Configure([('frame', frame), ('output', output)])
+    for desc, args in zip(('Frame', 'Output'), replies):
+      print('%s %s' % (desc, args[0]))
+  except ReadTimeout:
+    print('No response from %s' % (tty_name,))
+    sys.exit(1)
+  except GefenError as exc:
+    print(exc)
+    sys.exit(1)
+  finally:
+    converter.Close()
 
 
 if __name__ == '__main__':
   main()
-
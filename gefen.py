@@ -0,0 +1,123 @@
+#!/usr/bin/python
+"""Driver for the Gefen EXT-HDSDI-2-DVI converter's RS-232 interface.
+
+Commands are text lines ending in CR, like the pan/tilt frames of the
+cameras; each reply line is followed by an empty one.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+from he100 import CommandTable, PT
+from serialport import ReadTimeout, SerialPort
+
+_Now = getattr(time, 'monotonic', time.time)
+
+
+class GefenError(IOError):
+  """The converter answered a command with ERROR."""
+
+
+class HDSDI2DVI(CommandTable):
+  commands = (PT('frame', '#FRAME', '#FRAME %s', 'FRAME %s'),
+              PT('output', '#OUTPUT', '#OUTPUT %s', 'OUTPUT %s'),
+              PT('device type', '#DEVTYPE', None, '%s'),
+              PT('firmware version', '#DEVERSION', None, '%s'),
+              PT('commands', '#LIST', None, '%s'),
+             )
+
+
+class GefenConverter(object):
+  """Sends commands from a command table to one converter.
+
+  Commands given together go out in one write and their replies are read
+  in bulk against a single deadline of timeout seconds, so a converter that
+  is switched off or unplugged costs at most that long and raises
+  ReadTimeout instead of blocking. Anything left over from an earlier
+  exchange is discarded before the next one.
+  """
+
+  ERROR = 'ERROR'
+
+  def __init__(self, tty_name, baudrate=115200, timeout=2.0,
+               device=HDSDI2DVI):
+    self.device = device
+    self.timeout = timeout
+    self.port = SerialPort(tty_name, baudrate=baudrate,
+                           clear_modem_lines=False)
+    # End any partial command left in the converter's line buffer.
+    self.port.WriteFrame(b'\r\r\r')
+
+  def Close(self):
+    self.port.Close()
+
+  def Resolve(self, frame, kind):
+    return self.device.Resolve(frame, kind)
+
+  def Confirm(self, frame, args=()):
+    """Send the query form of frame and return the reply arguments."""
+    frame = self.Resolve(frame, 'confirm')
+    return self.Exchange([(frame, frame.EncodeConfirmationBytes(args))])[0]
+
+  def Control(self, frame, args=()):
+    """Send the control form of frame and return the reply arguments."""
+    return self.Configure([(frame, args)])[0]
+
+  def Configure(self, settings):
+    """Send (frame, args) control commands in one write.
+
+    Returns the reply arguments of each, in order.
+    """
+    commands = []
+    for frame, args in settings:
+      frame = self.Resolve(frame, 'control')
+      commands.append((frame, frame.EncodeControlBytes(args)))
+    return self.Exchange(commands)
+
+  def Identify(self):
+    """Return the device type, firmware version and command list."""
+    return [args[0] for args in self.Exchange(
+        [(frame, frame.EncodeConfirmationBytes())
+         for frame in (self.Resolve('device type', 'confirm'),
+                       self.Resolve('firmware version', 'confirm'),
+                       self.Resolve('commands', 'confirm'))])]
+
+  def Exchange(self, commands):
+    """Write encoded (frame, data) commands and decode a reply to each."""
+    while self.port.Read(timeout=0):
+      pass
+    self.port.WriteFrames([data for _, data in commands])
+    deadline = _Now() + self.timeout
+    return [self._Reply(frame, deadline) for frame, _ in commands]
+
+  def _Reply(self, frame, deadline):
+    while True:
+      line = self.port.ReadUntil(
+          (b'\r',), max(0, deadline - _Now())).decode('latin-1')
+      if line.strip():
+        break
+    if line.startswith(self.ERROR):
+      raise GefenError('%s refused %s' % (self.port.tty_name, frame.desc))
+    try:
+      return frame.DecodeReply(line).groups()
+    except ValueError:
+      raise GefenError('unexpected reply %r to %s' % (line, frame.desc))
+
+
+def main():
+  tty_name = sys.argv[1] if len(sys.argv) > 1 else '/dev/ttyS0'
+  converter = GefenConverter(tty_name)
+  try:
+    for name, value in zip(('Type', 'Version', 'Commands'),
+                           converter.Identify()):
+      print('%s: %s' % (name, value))
+  except ReadTimeout:
+    print('No response from %s' % (tty_name,))
+  finally:
+    converter.Close()
+
+
+if __name__ == '__main__':
+  main()
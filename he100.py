@@ -2,14 +2,128 @@
 
 import re
 
+# str and bytes, and unicode on Python 2.
+_STRING_TYPES = (str, bytes, bytearray, memoryview, type(u''))
+
+
+def _ToText(data):
+  """Return data as a str, decoding bytes-like input as latin-1."""
+  if isinstance(data, str):
+    return data
+  if not isinstance(data, _STRING_TYPES):
+    raise ValueError('%r is not a string' % (data,))
+  return bytes(data).decode('latin-1')
+
+
+def _ToBytes(data):
+  """Return data as bytes, encoding str input as latin-1."""
+  if isinstance(data, bytes):
+    return data
+  if isinstance(data, (bytearray, memoryview)):
+    return bytes(data)
+  if not isinstance(data, _STRING_TYPES):
+    raise ValueError('%r is not a string' % (data,))
+  return data.encode('latin-1')
+
+
+def _ChecksumByte(total):
+  cksum = total % 0x100
+  if cksum == 0:
+    cksum = 1
+  if cksum == 0x0D:
+    cksum = 0x0E
+  return cksum
+
+
+class _Template(object):
+  """A format compiled into a constant prefix and fixed width argument slots.
+
+  Encoding appends the prefix, then each argument followed by the literal
+  text after its slot, straight into a bytearray. The checksum starts from
+  the precomputed sum of the literal text and only adds the argument bytes.
+  """
+  __slots__ = ('fmt', 'prefix', 'slots', 'suffix', 'literal_sum', 'checksum')
+
+  def __init__(self, stx, fmt, etx, checksum):
+    self.fmt = fmt
+    self.checksum = checksum
+    literals = []
+    widths = []
+    position = 0
+    for match in CameraFrame._PCT_RE.finditer(fmt):
+      literals.append(_ToBytes(fmt[position:match.start()]))
+      width, conversion = match.groups()
+      if conversion == 's':
+        widths.append((None, False))
+      else:
+        widths.append((int(width or 1), conversion == 'd'))
+      position = match.end()
+    literals.append(_ToBytes(fmt[position:]))
+
+    self.prefix = _ToBytes(stx) + literals[0]
+    self.slots = tuple((width, numeric, literal) for (width, numeric), literal
+                       in zip(widths, literals[1:]))
+    self.suffix = _ToBytes(etx)
+    self.literal_sum = sum(bytearray(b''.join(literals)))
+
+  def EncodeInto(self, buf, args):
+    """Append the encoded frame to buf and return the number of bytes.
+
+    Raises ValueError, leaving buf as it was, if args do not fit.
+    """
+    if not isinstance(args, tuple):
+      args = (args,)
+    if len(args) != len(self.slots):
+      raise ValueError('%d arguments for %r' % (len(args), self.fmt))
+    start = len(buf)
+    try:
+      buf += self.prefix
+      total = self.literal_sum
+      for (width, numeric, literal), arg in zip(self.slots, args):
+        if numeric and not isinstance(arg, (bytes, str)):
+          try:
+            arg = b'%0*d' % (width, arg)
+          except TypeError:
+            raise ValueError('%r is not a number' % (arg,))
+        elif not isinstance(arg, bytes):
+          arg = _ToBytes(arg)
+        if width is not None and len(arg) != width:
+          raise ValueError('%r is not %d characters for %r' %
+                           (arg, width, self.fmt))
+        buf += arg
+        buf += literal
+        if self.checksum:
+          total += sum(bytearray(arg))
+    except ValueError:
+      del buf[start:]  # Leave nothing of a half encoded frame behind.
+      raise
+    if self.checksum:
+      buf.append(_ChecksumByte(total))
+    buf += self.suffix
+    return len(buf) - start
+
+
+_UNSET = object()
+
 
 class CameraFrame(object):
+  """One command of a command table.
+
+  The regular expressions and encoding templates are only compiled the first
+  time they are used, so importing a table costs little more than creating
+  the tuples of format strings.
+  """
+  __slots__ = ('desc', 'confirm_format', 'control_format', 'reply_format',
+               'checksum', '_confirm_re', '_control_re', '_reply_re',
+               '_templates')
+
   STX = ''
   ETX = ''
 
   _PCT_C_RE = re.compile(r'%(\d*)c')
   _PCT_D_RE = re.compile(r'%(\d*)d')
   _PCT_S_RE = re.compile(r'%s')
+  _PCT_RE = re.compile(r'%(\d*)([cds])')
 
   def __init__(self, desc, confirm_format, control_format, reply_format,
                checksum=False):
@@ -18,32 +132,132 @@ class CameraFrame(object):
     self.control_format = control_format
     self.reply_format = reply_format
     self.checksum = checksum
-    self.confirm_re = self._FormatToRE(confirm_format, checksum)
-    self.control_re = self._FormatToRE(control_format, checksum)
-    self.reply_re = self._FormatToRE(reply_format, checksum)
+    self._confirm_re = _UNSET
+    self._control_re = _UNSET
+    self._reply_re = _UNSET
+    self._templates = None
+
+  @property
+  def confirm_re(self):
+    if self._confirm_re is _UNSET:
+      self._confirm_re = self._FormatToRE(self.confirm_format, self.checksum)
+    return self._confirm_re
+
+  @property
+  def control_re(self):
+    if self._control_re is _UNSET:
+      self._control_re = self._FormatToRE(self.control_format, self.checksum)
+    return self._control_re
+
+  @property
+  def reply_re(self):
+    if self._reply_re is _UNSET:
+      self._reply_re = self._FormatToRE(self.reply_format, self.checksum)
+    return self._reply_re
 
   def _Checksum(self, cmd):
-    cksum = sum([ord(x) for x in cmd]) % 0x100
-    if cksum == 0:
-      cksum = 1
-    if cksum == 0x0D:
-      cksum = 0x0E
-    return cksum
-
-  def EncodeConfirmation(self, args):
-    cmd = self.confirm_format % args
+    return _ChecksumByte(sum(map(ord, cmd)))
+
+  def _Template(self, kind):
+    if self._templates is None:
+      self._templates = {}
+    template = self._templates.get(kind)
+    if template is None:
+      fmt = getattr(self, kind + '_format')
+      if fmt is None:
+        raise ValueError('%s has no %s command' % (self.desc, kind))
+      template = self._templates[kind] = _Template(self.STX, fmt, self.ETX,
+                                                   self.checksum)
+    return template
+
+  def EncodeConfirmationInto(self, buf, args=()):
+    """Append the encoded confirmation to the bytearray buf.
+
+    Arguments may be bytes or str, or ints for %d fields; anything else
+    raises ValueError, as with EncodeConfirmation(). Returns the number of
+    bytes appended.
+    """
+    return self._Template('confirm').EncodeInto(buf, args)
+
+  def EncodeControlInto(self, buf, args=()):
+    """Append the encoded control command to the bytearray buf."""
+    return self._Template('control').EncodeInto(buf, args)
+
+  def EncodeConfirmationBytes(self, args=()):
+    buf = bytearray()
+    self._Template('confirm').EncodeInto(buf, args)
+    return bytes(buf)
+
+  def EncodeControlBytes(self, args=()):
+    buf = bytearray()
+    self._Template('control').EncodeInto(buf, args)
+    return bytes(buf)
+
+  def EncodeReplyBytes(self, args=()):
+    """Encode a reply as the camera would send it, for simulators."""
+    buf = bytearray()
+    self._Template('reply').EncodeInto(buf, args)
+    return bytes(buf)
+
+  def Widths(self, kind='reply'):
+    """Return the width of each argument of a format, None for %s."""
+    return [width for width, _, _ in self._Template(kind).slots]
+
+  def Size(self, kind='reply'):
+    """Return the encoded length of a format in bytes, None if it has %s."""
+    template = self._Template(kind)
+    size = len(template.prefix) + len(template.suffix) + template.checksum
+    for width, _, literal in template.slots:
+      if width is None:
+        return None
+      size += width + len(literal)
+    return size
+
+  def _Format(self, fmt, args):
+    """Substitute args into fmt, %Nc and %Nd taking N character fields.
+
+    %d fields also take ints; any other argument that is not a string
+    raises ValueError.
+    """
+    if fmt is None:
+      raise ValueError('%s has no such command' % (self.desc,))
+    if not isinstance(args, tuple):
+      args = (args,)
+    args = list(args)
+
+    def repl(match):
+      if not args:
+        raise ValueError('Not enough arguments for %r' % (fmt,))
+      value = args.pop(0)
+      width, conversion = match.groups()
+      if conversion == 's':
+        return _ToText(value)
+      width = int(width or 1)
+      if conversion == 'd' and not isinstance(value, (str, bytes)):
+        try:
+          value = '%0*d' % (width, value)
+        except TypeError:
+          raise ValueError('%r is not a number' % (value,))
+      value = _ToText(value)
+      if len(value) != width:
+        raise ValueError('%r is not %d characters for %r' %
+                         (value, width, fmt))
+      return value
+    cmd = self._PCT_RE.sub(repl, fmt)
+    if args:
+      raise ValueError('Too many arguments for %r' % (fmt,))
+    return cmd
+
+  def EncodeConfirmation(self, args=()):
+    cmd = self._Format(self.confirm_format, args)
     if self.checksum:
-      cksum = self._Checksum(cmd)
-      cksum = ('%02X' % cksum).decode('hex')
-      cmd = cmd + cksum
+      cmd = cmd + chr(self._Checksum(cmd))
     return self.STX + cmd + self.ETX
 
-  def EncodeControl(self, args):
-    cmd = self.control_format % args
+  def EncodeControl(self, args=()):
+    cmd = self._Format(self.control_format, args)
     if self.checksum:
-      cksum = self._Checksum(cmd)
-      cksum = ('%02X' % cksum).decode('hex')
-      cmd = cmd + cksum
+      cmd = cmd + chr(self._Checksum(cmd))
     return self.STX + cmd + self.ETX
 
   def DecodeReply(self, cmd):
@@ -99,17 +313,132 @@ class CameraFrame(object):
     return re.compile(fmt)
 
 
+class Dispatcher(object):
+  """Index of a command table for decoding frames without a linear scan.
+
+  Frames are bucketed by their framing and by the literal text in front of the
+  first conversion of the chosen format ('OSD:4B:', 'aGL', 'gz'). Decoding
+  strips the framing once, looks up the longest matching literal prefix and
+  only tries the expressions of the frames in that bucket. Formats with no
+  literal prefix (such as '%s') are only tried when nothing else matches.
+  """
+
+  def __init__(self, frames, kind='reply'):
+    self.kind = kind
+    self._attr = kind + '_re'
+    framings = {}
+    for frame in frames:
+      fmt = getattr(frame, kind + '_format')
+      if not fmt:
+        continue
+      prefix = fmt.split('%', 1)[0]
+      buckets = framings.setdefault((frame.STX, frame.ETX), {})
+      buckets.setdefault(prefix, []).append(frame)
+
+    # Framings with a start byte are checked first as they are unambiguous.
+    self._framings = []
+    for (stx, etx), buckets in sorted(framings.items(), reverse=True):
+      lengths = sorted(set(len(prefix) for prefix in buckets), reverse=True)
+      self._framings.append((stx, etx, lengths, buckets))
+
+  def Decode(self, cmd):
+    """Return (frame, args) for a framed cmd, failure raises ValueError."""
+    cmd = _ToText(cmd)
+    for stx, etx, lengths, buckets in self._framings:
+      payload = cmd
+      if stx:
+        if payload[:1] != stx:
+          continue
+        payload = payload[1:]
+      if etx:
+        if payload[-1:] != etx:
+          continue
+        payload = payload[:-1]
+      result = self._Match(payload, lengths, buckets)
+      if result is not None:
+        return result
+    raise ValueError('No match')
+
+  def DecodePayload(self, payload, framing):
+    """Return (frame, args) for an unframed payload of the framing class."""
+    payload = _ToText(payload)
+    for stx, etx, lengths, buckets in self._framings:
+      if (stx, etx) != (framing.STX, framing.ETX):
+        continue
+      result = self._Match(payload, lengths, buckets)
+      if result is not None:
+        return result
+    raise ValueError('No match')
+
+  def _Match(self, payload, lengths, buckets):
+    size = len(payload)
+    for length in lengths:
+      if length > size:
+        continue
+      bucket = buckets.get(payload[:length])
+      if bucket is None:
+        continue
+      for frame in bucket:
+        result = getattr(frame, self._attr).match(payload)
+        if result is not None:
+          return frame, result.groups()
+    return None
+
+
 class CCP(CameraFrame):
+  __slots__ = ()
   STX = '\x02'
   ETX = '\x03'
 
 
 class PT(CameraFrame):
+  __slots__ = ()
   STX=''
   ETX='\r'
 
 
-class HE100(object):
+class CommandTable(object):
+  """A device's command table, with its frames found by desc or by reply.
+
+  Subclasses list their CameraFrames in commands.
+  """
+
+  commands = ()
+  _dispatchers = {}
+
+  @classmethod
+  def GetDispatcher(cls, kind='reply'):
+    """Return the Dispatcher for kind ('reply', 'confirm' or 'control')."""
+    key = (cls, kind)
+    dispatcher = cls._dispatchers.get(key)
+    if dispatcher is None:
+      dispatcher = cls._dispatchers[key] = Dispatcher(cls.commands, kind)
+    return dispatcher
+
+  @classmethod
+  def Find(cls, desc, kind=None):
+    """Return the first frame called desc, with a kind format if given."""
+    for frame in cls.commands:
+      if frame.desc != desc:
+        continue
+      if kind is None or getattr(frame, kind + '_format'):
+        return frame
+    raise KeyError(desc)
+
+  @classmethod
+  def DecodeReply(cls, cmd):
+    """Return (frame, args) for a framed reply, failure raises ValueError."""
+    return cls.GetDispatcher().Decode(cmd)
+
+  @classmethod
+  def Resolve(cls, frame, kind):
+    """Return frame, or the frame Find(frame, kind) names if it is a desc."""
+    if isinstance(frame, (str, type(u''))):
+      frame = cls.Find(frame, kind)
+    return frame
+
+
+class HE100(CommandTable):
   commands = (CCP('model number', 'QID', None, 'OID:%2c'),
               CCP('software version', 'QSV', None, 'OSV:%s'), # Unsure of rlen
               CCP('AWC/AWB', None, 'OWS', 'OWS'),
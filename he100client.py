@@ -0,0 +1,359 @@
+#!/usr/bin/python3
+"""asyncio client for HE100 cameras on a serial port."""
+
+import asyncio
+import collections
+import time
+
+import metrics
+from asyncport import OpenSerialConnection
+from framing import Ack, StreamParser
+from he100 import HE100
+from pacer import Pacer
+from scheduler import QUERY, Classify, SendScheduler
+
+
+class CameraError(Exception):
+  """The camera answered a command with an error reply such as ER3."""
+
+  def __init__(self, frame, code):
+    Exception.__init__(self, '%s: error %s' % (frame.desc, code))
+    self.frame = frame
+    self.code = code
+
+
+class _Request(object):
+  __slots__ = ('entry', 'frame', 'data', 'waiters', 'sent', 'timer')
+
+  def __init__(self, entry, sent):
+    self.entry = entry
+    self.frame = entry.frame
+    self.data = entry.data
+    self.waiters = entry.waiters
+    self.sent = sent
+    self.timer = None
+
+
+def _SameReply(a, b):
+  return a.reply_format == b.reply_format and a.ETX == b.ETX
+
+
+class HE100Client(asyncio.Protocol):
+  """Encodes commands from a command table and awaits their decoded replies.
+
+  Commands wait in a SendScheduler and are written one at a time, each once
+  the previous one has had time to leave the port at its baud rate, so that
+  stops and speeds overtake queued queries and superseded speeds are never
+  sent. Up to window commands that expect a reply are outstanding at a
+  time; commands without a reply format (pan/tilt/zoom speeds) may be
+  written while the window is full.
+
+  A Pacer adds a gap after each command, shrinking it while the camera
+  keeps up and backing off when it answers ER3 or leaves a control command
+  unanswered; stops wait for the link only, never for the gap. Commands
+  refused with ER3, and queries that time out, are sent again within the
+  pacer's retry budget.
+
+  Each reply goes to the oldest outstanding command with the same reply
+  format, and an error reply to the command it names, or else to the oldest
+  command of the same framing. Replies that do not answer an outstanding
+  command, such as preset complete notifications, are passed to the
+  listeners added with AddListener().
+
+  With metrics enabled, frames, decode failures, error replies, discarded
+  bytes, round trip times and the number of queued commands are recorded
+  under the port name.
+
+  With a StateCache every decoded reply, solicited or not, and every control
+  command sent is recorded in it, and Get() answers from it when it can.
+  """
+
+  ERROR_PREFIX = 'ER'
+
+  def __init__(self, camera=HE100, timeout=1.0, window=1, cache=None,
+               starvation=1.0, pacer=None):
+    self.camera = camera
+    self.timeout = timeout
+    self.window = window
+    self.cache = cache
+    self.transport = None
+    self.port_name = None
+    self.scheduler = SendScheduler(starvation)
+    self.pacer = pacer if pacer is not None else Pacer()
+    self._byte_time = 0.0
+    self._link_until = 0.0
+    self._busy_until = 0.0
+    self._wakeup = None
+    self._dispatcher = camera.GetDispatcher()
+    self._parser = StreamParser()
+    self._pending = collections.deque()
+    self._listeners = []
+    self._control_listeners = []
+    self._write_listeners = []
+
+  def connection_made(self, transport):
+    self.transport = transport
+    self.port_name = transport.get_extra_info('tty_name')
+    baudrate = transport.get_extra_info('baudrate')
+    if baudrate:
+      self._byte_time = 10.0 / baudrate
+
+  def connection_lost(self, exc):
+    self.transport = None
+    if self._wakeup is not None:
+      self._wakeup.cancel()
+      self._wakeup = None
+    exc = exc or ConnectionError('port closed')
+    while self._pending:
+      self._Finish(self._pending[0], exc=exc)
+    for entry in self.scheduler.Clear():
+      _Settle(entry.waiters, exc=exc)
+    self._NoteQueue()
+
+  def data_received(self, data):
+    discarded = self._parser.discarded
+    frames = self._parser.Feed(data)
+    if metrics.enabled:
+      labels = (self.port_name,)
+      metrics.FRAMES_RECEIVED.Inc(labels, len(frames))
+      if self._parser.discarded != discarded:
+        metrics.DISCARDED_BYTES.Inc(labels,
+                                    self._parser.discarded - discarded)
+    for frame in frames:
+      if isinstance(frame, Ack):
+        self.pacer.OnReply()
+      else:
+        self._HandleFrame(frame)
+
+  def _HandleFrame(self, frame):
+    try:
+      reply, args = self._dispatcher.Decode(frame.raw)
+    except ValueError:
+      if metrics.enabled:
+        metrics.DECODE_FAILURES.Inc((self.port_name,))
+      return
+
+    if reply.reply_format.startswith(self.ERROR_PREFIX):
+      if metrics.enabled:
+        metrics.CAMERA_ERRORS.Inc((self.port_name, reply.desc))
+      request = self._MatchError(reply, args)
+      if request is not None:
+        self._Busy()
+        self._Finish(request, exc=CameraError(request.frame, args[0]),
+                     retry=True)
+        return
+    else:
+      for request in self._pending:
+        if _SameReply(request.frame, reply):
+          if self.cache is not None:
+            if self._ControlArgs(request.frame, request.data) is None:
+              self.cache.Update(request.frame, args)
+            else:
+              self.cache.OnControlReply(request.frame, args)
+          self._Finish(request, args)
+          return
+      if self.cache is not None:
+        self.cache.Update(reply, args)
+
+    for listener in list(self._listeners):
+      listener(reply, args)
+
+  def _MatchError(self, reply, args):
+    code = args[0].encode('latin-1') if args else b''
+    candidates = [request for request in self._pending
+                  if request.frame.STX == reply.STX]
+    for request in candidates:
+      if code and request.data[len(reply.STX):].startswith(code):
+        return request
+    if candidates:
+      return candidates[0]
+    return None
+
+  def AddListener(self, callback):
+    """Call callback(frame, args) for every reply nobody was waiting for."""
+    self._listeners.append(callback)
+
+  def RemoveListener(self, callback):
+    self._listeners.remove(callback)
+
+  def AddControlListener(self, callback):
+    """Call callback(frame, args) for every control command queued."""
+    self._control_listeners.append(callback)
+
+  def RemoveControlListener(self, callback):
+    self._control_listeners.remove(callback)
+
+  def AddWriteListener(self, callback):
+    """Call callback(frame, data) as each command is written to the port."""
+    self._write_listeners.append(callback)
+
+  def RemoveWriteListener(self, callback):
+    self._write_listeners.remove(callback)
+
+  def Resolve(self, frame, kind):
+    return self.camera.Resolve(frame, kind)
+
+  async def Confirm(self, frame, args=(), timeout=None):
+    """Send the confirmation form of frame and return the reply arguments."""
+    frame = self.Resolve(frame, 'confirm')
+    return await self.Send(frame, frame.EncodeConfirmationBytes(args),
+                           timeout)
+
+  async def Control(self, frame, args=(), timeout=None):
+    """Send the control form of frame and return the reply arguments.
+
+    Returns None once written for commands which have no reply.
+    """
+    frame = self.Resolve(frame, 'control')
+    return await self.Send(frame, frame.EncodeControlBytes(args), timeout)
+
+  async def Send(self, frame, data, timeout=None, priority=None):
+    """Queue an already encoded command for frame and await its reply.
+
+    priority is a scheduler class; by default it follows from the command.
+    timeout counts from when the command is written.
+    """
+    if self.transport is None:
+      raise ConnectionError('not connected')
+    if isinstance(data, str):
+      data = data.encode('latin-1')
+    args = self._ControlArgs(frame, data)
+    if args is not None:
+      if self.cache is not None:
+        self.cache.OnControl(frame, args)
+      for listener in list(self._control_listeners):
+        listener(frame, args)
+    if priority is None:
+      priority = Classify(frame, args)
+    if timeout is None:
+      timeout = self.timeout
+    entry = self.scheduler.Put(frame, data, priority, timeout)
+    future = asyncio.get_running_loop().create_future()
+    entry.waiters.append(future)
+    self._Pump()
+    self._NoteQueue()
+    return await future
+
+  def _ControlArgs(self, frame, data):
+    """Return the arguments if data is the control form of frame."""
+    if not frame.control_format:
+      return None
+    payload = data[len(frame.STX):len(data) - len(frame.ETX)]
+    result = frame.control_re.match(payload.decode('latin-1'))
+    if result is None:
+      return None
+    return result.groups()
+
+  def _Pump(self):
+    """Write queued commands while the link and the window allow."""
+    if self._wakeup is not None:
+      self._wakeup.cancel()
+      self._wakeup = None
+    loop = asyncio.get_running_loop()
+    while self.transport is not None:
+      now = loop.time()
+      if now < self._link_until:
+        if self.scheduler and self._wakeup is None:
+          self._wakeup = loop.call_at(self._link_until, self._Pump)
+        return
+      # Stops only wait for the link, not for the pacer's gap.
+      held = now < self._busy_until
+      entry = self.scheduler.Pop(len(self._pending) < self.window, held)
+      if entry is None:
+        if held and self.scheduler and self._wakeup is None:
+          self._wakeup = loop.call_at(self._busy_until, self._Pump)
+        return
+      if all(waiter.done() for waiter in entry.waiters):
+        continue  # Everyone waiting for it has given up.
+
+      self.transport.write(entry.data)
+      entry.attempts += 1
+      for listener in list(self._write_listeners):
+        listener(entry.frame, entry.data)
+      self._link_until = now + len(entry.data) * self._byte_time
+      self._busy_until = max(self._busy_until,
+                             self._link_until + self.pacer.gap)
+      if metrics.enabled:
+        metrics.FRAMES_SENT.Inc((self.port_name,))
+      if entry.expects_reply:
+        request = _Request(entry, time.monotonic())
+        request.timer = loop.call_later(entry.timeout, self._Expire, request)
+        self._pending.append(request)
+      else:
+        _Settle(entry.waiters, None)
+      self._NoteQueue()
+
+  def _Expire(self, request):
+    if metrics.enabled:
+      metrics.TIMEOUTS.Inc((self.port_name, request.frame.desc))
+    query = request.entry.priority == QUERY
+    # An unanswered query more likely asks for something the camera does
+    # not have than finds it busy, and is the only kind safe to repeat
+    # when we cannot tell if it arrived.
+    if not query:
+      self._Busy()
+    self._Finish(request, exc=asyncio.TimeoutError(), retry=query)
+
+  def _Busy(self):
+    """Back off, holding all sending for the pacer's new gap."""
+    gap = self.pacer.OnBusy()
+    self._busy_until = max(self._busy_until,
+                           asyncio.get_running_loop().time() + gap)
+
+  def _Finish(self, request, result=None, exc=None, retry=False):
+    self._pending.remove(request)
+    request.timer.cancel()
+    entry = request.entry
+    if exc is None:
+      latency = time.monotonic() - request.sent
+      self.pacer.OnReply(latency)
+      if metrics.enabled:
+        metrics.ROUND_TRIP.Observe((self.port_name, request.frame.desc),
+                                   latency)
+    if (retry and self.transport is not None and
+        self.pacer.Retry(entry.attempts)):
+      self.scheduler.Requeue(entry)
+    else:
+      _Settle(request.waiters, result, exc)
+    if self.transport is not None:
+      self._Pump()
+    self._NoteQueue()
+
+  def _NoteQueue(self):
+    if metrics.enabled:
+      metrics.QUEUE_DEPTH.Set((self.port_name,),
+                              len(self.scheduler) + len(self._pending))
+
+  async def Get(self, frame, max_age=None, timeout=None):
+    """Return the value of frame from the cache, or query the camera."""
+    frame = self.Resolve(frame, 'confirm')
+    if self.cache is not None:
+      args = self.cache.Get(frame, max_age)
+      if args is not None:
+        return args
+    return await self.Confirm(frame, timeout=timeout)
+
+  def Close(self):
+    if self.transport is not None:
+      self.transport.close()
+
+
+def _Settle(waiters, result=None, exc=None):
+  for waiter in waiters:
+    if not waiter.done():
+      if exc is None:
+        waiter.set_result(result)
+      else:
+        waiter.set_exception(exc)
+
+
+async def Connect(tty_name, camera=HE100, timeout=1.0, window=1, cache=None,
+                  starvation=1.0, pacer=None, **kwargs):
+  """Open tty_name and return a connected HE100Client.
+
+  Keyword arguments are passed on to SerialPort.
+  """
+  _, client = await OpenSerialConnection(
+      lambda: HE100Client(camera, timeout, window, cache, starvation, pacer),
+      tty_name, **kwargs)
+  return client
@@ -0,0 +1,274 @@
+#!/usr/bin/python3
+"""Control of network connected Panasonic heads over their HTTP interface.
+
+PT commands go to /cgi-bin/aw_ptz and CCP camera commands to
+/cgi-bin/aw_cam, as cmd=<command without framing>&res=1; the body of the
+response is the reply without framing.
+
+Usage: httpport.py <host>[:<port>] [<host>[:<port>] ...]
+"""
+
+import asyncio
+import collections
+import sys
+import time
+
+try:
+  from urllib.parse import quote
+except ImportError:
+  from urllib import quote
+
+import metrics
+from he100 import HE100
+from he100client import CameraError
+
+PTZ_PATH = '/cgi-bin/aw_ptz'
+CAM_PATH = '/cgi-bin/aw_cam'
+
+
+class HTTPError(IOError):
+  """The head answered with an HTTP error status."""
+
+
+class _Connection(object):
+  """One keep-alive connection; responses come back in request order."""
+
+  def __init__(self, host, port):
+    self.host = host
+    self.port = port
+    self.waiting = collections.deque()
+    self.closed = False
+    self._writer = None
+    self._opened = asyncio.ensure_future(self._Open())
+    self._reader_task = None
+
+  async def _Open(self):
+    reader, self._writer = await asyncio.open_connection(self.host, self.port)
+    self._reader_task = asyncio.ensure_future(self._ReadLoop(reader))
+
+  async def Submit(self, request):
+    """Write request and return a future for its (status, headers, body)."""
+    future = asyncio.get_running_loop().create_future()
+    self.waiting.append(future)
+    try:
+      await asyncio.shield(self._opened)
+    except OSError as exc:
+      self.Close(exc)
+      raise ConnectionError('cannot connect to %s:%d' % (self.host, self.port))
+    except asyncio.CancelledError:
+      if not self.closed:
+        raise  # The caller gave up, e.g. timed out.
+    if self.closed:
+      raise ConnectionError('connection to %s closed' % (self.host,))
+    self._writer.write(request)
+    return future
+
+  async def _ReadLoop(self, reader):
+    exc = None
+    try:
+      while True:
+        response = await _ReadResponse(reader)
+        if response is None:
+          break
+        if not self.waiting:
+          raise HTTPError('unexpected response from %s' % (self.host,))
+        future = self.waiting.popleft()
+        if not future.done():
+          future.set_result(response)
+        if response[1].get('connection', '').lower() == 'close':
+          break
+    except (OSError, ValueError, asyncio.IncompleteReadError) as error:
+      exc = error
+    self.Close(exc)
+
+  def Close(self, exc=None):
+    if self.closed:
+      return
+    self.closed = True
+    exc = exc or ConnectionError('connection to %s closed' % (self.host,))
+    if not isinstance(exc, ConnectionError):
+      exc = ConnectionError(str(exc))
+    while self.waiting:
+      future = self.waiting.popleft()
+      if not future.done():
+        future.set_exception(exc)
+    if self._reader_task is not None:
+      self._reader_task.cancel()
+    if self._writer is not None:
+      self._writer.close()
+    self._opened.cancel()
+
+
+async def _ReadResponse(reader):
+  """Return (status, headers, body) of the next response, None at EOF."""
+  status_line = await reader.readline()
+  if not status_line:
+    return None
+  parts = status_line.split(None, 2)
+  if len(parts) < 2 or not parts[0].startswith(b'HTTP/'):
+    raise ValueError('bad status line %r' % (status_line,))
+  status = int(parts[1])
+  headers = {}
+  while True:
+    line = await reader.readline()
+    if line in (b'\r\n', b'\n', b''):
+      break
+    name, _, value = line.decode('latin-1').partition(':')
+    headers[name.strip().lower()] = value.strip()
+
+  if headers.get('transfer-encoding', '').lower() == 'chunked':
+    chunks = []
+    while True:
+      size = int((await reader.readline()).split(b';')[0], 16)
+      if not size:
+        await reader.readline()
+        break
+      chunks.append(await reader.readexactly(size))
+      await reader.readline()
+    body = b''.join(chunks)
+  elif 'content-length' in headers:
+    body = await reader.readexactly(int(headers['content-length']))
+  else:
+    body = await reader.read()
+    headers['connection'] = 'close'
+  return status, headers, body
+
+
+class HTTPCamera(object):
+  """Sends commands from a command table to one head over HTTP.
+
+  Keeps up to connections persistent connections and up to pipeline
+  requests in flight on each, spreading requests over the least busy one,
+  so a joystick costs no connection setup per command. A request not
+  answered within its timeout fails, and its connection is dropped with it
+  since later responses on it could no longer be matched; requests queued
+  behind it fail with ConnectionError.
+
+  Confirm(), Control() and Send() behave as in HE100Client.
+  """
+
+  ERROR_PREFIX = 'ER'
+
+  def __init__(self, host, port=80, camera=HE100, timeout=1.0,
+               connections=2, pipeline=4):
+    self.host = host
+    self.port = port
+    self.camera = camera
+    self.timeout = timeout
+    self.connections = connections
+    self.pipeline = pipeline
+    self.name = 'http://%s:%d' % (host, port)
+    self._pool = []
+    self._slots = asyncio.Semaphore(connections * pipeline)
+
+  def Resolve(self, frame, kind):
+    return self.camera.Resolve(frame, kind)
+
+  async def Confirm(self, frame, args=(), timeout=None):
+    """Send the confirmation form of frame and return the reply arguments."""
+    frame = self.Resolve(frame, 'confirm')
+    return await self.Send(frame, frame.EncodeConfirmationBytes(args),
+                           timeout)
+
+  async def Control(self, frame, args=(), timeout=None):
+    """Send the control form of frame; returns None if it has no reply."""
+    frame = self.Resolve(frame, 'control')
+    return await self.Send(frame, frame.EncodeControlBytes(args), timeout)
+
+  async def Send(self, frame, data, timeout=None):
+    """Send an encoded (serial framed) command and decode the reply."""
+    if isinstance(data, str):
+      data = data.encode('latin-1')
+    payload = data[len(frame.STX):len(data) - len(frame.ETX)]
+    path = CAM_PATH if frame.STX else PTZ_PATH
+    body = await self.Get('%s?cmd=%s&res=1' % (path, quote(payload)),
+                          timeout, frame.desc)
+    if metrics.enabled:
+      metrics.FRAMES_RECEIVED.Inc((self.name,))
+    text = body.decode('latin-1').strip()
+    if text.startswith(self.ERROR_PREFIX):
+      if metrics.enabled:
+        code = text[len(self.ERROR_PREFIX):].partition(':')[0]
+        metrics.CAMERA_ERRORS.Inc((self.name, 'error ' + code))
+      raise CameraError(frame, text.partition(':')[2])
+    if not frame.reply_format:
+      return None
+    if not frame.checksum:
+      return frame.DecodeReply(frame.STX + text + frame.ETX).groups()
+    # Unlike on the serial link, replies over HTTP carry no checksum.
+    result = frame.DecodeReply(frame.STX + text + '\0' + frame.ETX)
+    return result.groups()[:-1]
+
+  def _Connection(self):
+    self._pool = [conn for conn in self._pool if not conn.closed]
+    idle = [conn for conn in self._pool if not conn.waiting]
+    if idle:
+      return idle[0]
+    if len(self._pool) < self.connections:
+      conn = _Connection(self.host, self.port)
+      self._pool.append(conn)
+      return conn
+    return min(self._pool, key=lambda conn: len(conn.waiting))
+
+  async def Get(self, path, timeout=None, label='http'):
+    """GET path on the head and return the response body."""
+    if timeout is None:
+      timeout = self.timeout
+    request = ('GET %s HTTP/1.1\r\nHost: %s\r\nConnection: keep-alive\r\n\r\n'
+               % (path, self.host)).encode('latin-1')
+    async with self._slots:
+      conn = self._Connection()
+      start = time.monotonic()
+      if metrics.enabled:
+        metrics.FRAMES_SENT.Inc((self.name,))
+        metrics.BYTES_SENT.Inc((self.name,), len(request))
+      try:
+        status, _, body = await asyncio.wait_for(
+            self._Exchange(conn, request), timeout)
+      except asyncio.TimeoutError:
+        conn.Close()
+        if metrics.enabled:
+          metrics.TIMEOUTS.Inc((self.name, label))
+        raise
+    if metrics.enabled:
+      metrics.BYTES_RECEIVED.Inc((self.name,), len(body))
+      metrics.ROUND_TRIP.Observe((self.name, label),
+                                 time.monotonic() - start)
+    if status != 200:
+      raise HTTPError('%s%s: HTTP %d' % (self.name, path, status))
+    return body
+
+  async def _Exchange(self, conn, request):
+    return await (await conn.Submit(request))
+
+  def Close(self):
+    for conn in self._pool:
+      conn.Close()
+    self._pool = []
+
+
+async def _Main(addresses):
+  cameras = []
+  for address in addresses:
+    host, _, port = address.partition(':')
+    cameras.append(HTTPCamera(host, int(port or 80)))
+  try:
+    results = await asyncio.gather(
+        *[camera.Confirm('model number') for camera in cameras],
+        return_exceptions=True)
+    for camera, result in zip(cameras, results):
+      print('%s: %s' % (camera.name, result))
+  finally:
+    for camera in cameras:
+      camera.Close()
+
+
+def main():
+  if len(sys.argv) < 2:
+    print(__doc__.strip())
+    sys.exit(1)
+  asyncio.run(_Main(sys.argv[1:]))
+
+
+if __name__ == '__main__':
+  main()
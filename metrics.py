@@ -0,0 +1,263 @@
+#!/usr/bin/python
+"""Counters and histograms for the serial link and the camera client.
+
+Collection is off until Enable() is called (or PANACONTROL_METRICS is set in
+the environment); until then every instrumented call site only tests the
+module level enabled flag. Values can be read with Snapshot(), rendered in
+the Prometheus text format with Render(), or served over HTTP with Serve().
+"""
+
+import bisect
+import os
+import threading
+
+enabled = bool(os.environ.get('PANACONTROL_METRICS'))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def Enable():
+  global enabled
+  enabled = True
+
+
+def Disable():
+  global enabled
+  enabled = False
+
+
+def _Escape(value):
+  return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+          .replace('\n', '\\n'))
+
+
+def _Labels(names, values, extra=()):
+  pairs = list(zip(names, values)) + list(extra)
+  if not pairs:
+    return ''
+  return '{%s}' % ','.join('%s="%s"' % (name, _Escape(value))
+                           for name, value in pairs)
+
+
+def _Number(value):
+  if value == float('inf'):
+    return '+Inf'
+  if value == int(value):
+    return '%d' % value
+  return repr(float(value))
+
+
+class _Metric(object):
+  kind = None
+
+  def __init__(self, name, help_text, labels=()):
+    self.name = name
+    self.help = help_text
+    self.labels = tuple(labels)
+    self._values = {}
+    self._lock = threading.Lock()
+
+  def _Check(self, labels):
+    if len(labels) != len(self.labels):
+      raise ValueError('%s takes labels %r, not %r' %
+                       (self.name, self.labels, labels))
+
+  def Clear(self):
+    with self._lock:
+      self._values.clear()
+
+  def Snapshot(self):
+    """Return a dict of label values tuple to the current value."""
+    with self._lock:
+      return dict(self._values)
+
+  def Render(self):
+    lines = ['# HELP %s %s' % (self.name, self.help),
+             '# TYPE %s %s' % (self.name, self.kind)]
+    for labels, value in sorted(self.Snapshot().items()):
+      lines.append('%s%s %s' % (self.name, _Labels(self.labels, labels),
+                                _Number(value)))
+    return lines
+
+
+class Counter(_Metric):
+  """A value that only goes up, such as bytes sent."""
+
+  kind = 'counter'
+
+  def Inc(self, labels=(), amount=1):
+    self._Check(labels)
+    with self._lock:
+      self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+  """A value that goes up and down, such as a queue depth."""
+
+  kind = 'gauge'
+
+  def Set(self, labels, value):
+    self._Check(labels)
+    with self._lock:
+      self._values[labels] = value
+
+
+class _Buckets(object):
+  __slots__ = ('counts', 'sum', 'count')
+
+  def __init__(self, size):
+    self.counts = [0] * size
+    self.sum = 0.0
+    self.count = 0
+
+
+class Histogram(_Metric):
+  """Observations counted into buckets by upper bound, e.g. latencies."""
+
+  kind = 'histogram'
+
+  def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+    _Metric.__init__(self, name, help_text, labels)
+    self.buckets = tuple(sorted(buckets))
+
+  def Observe(self, labels, value):
+    self._Check(labels)
+    index = bisect.bisect_left(self.buckets, value)
+    with self._lock:
+      entry = self._values.get(labels)
+      if entry is None:
+        entry = self._values[labels] = _Buckets(len(self.buckets) + 1)
+      entry.counts[index] += 1
+      entry.sum += value
+      entry.count += 1
+
+  def Snapshot(self):
+    """Return label values to a dict of cumulative buckets, sum and count."""
+    with self._lock:
+      result = {}
+      for labels, entry in self._values.items():
+        cumulative, total = [], 0
+        for count in entry.counts:
+          total += count
+          cumulative.append(total)
+        bounds = self.buckets + (float('inf'),)
+        result[labels] = {'buckets': list(zip(bounds, cumulative)),
+                          'sum': entry.sum, 'count': entry.count}
+      return result
+
+  def Render(self):
+    lines = ['# HELP %s %s' % (self.name, self.help),
+             '# TYPE %s %s' % (self.name, self.kind)]
+    for labels, value in sorted(self.Snapshot().items()):
+      for bound, count in value['buckets']:
+        lines.append('%s_bucket%s %d' % (
+            self.name, _Labels(self.labels, labels, [('le', _Number(bound))]),
+            count))
+      label_text = _Labels(self.labels, labels)
+      lines.append('%s_sum%s %s' % (self.name, label_text,
+                                    repr(value['sum'])))
+      lines.append('%s_count%s %d' % (self.name, label_text, value['count']))
+    return lines
+
+
+class Registry(object):
+  """A named set of metrics, rendered together."""
+
+  def __init__(self):
+    self.metrics = []
+
+  def Register(self, metric):
+    if any(existing.name == metric.name for existing in self.metrics):
+      raise ValueError('Duplicate metric %s' % (metric.name,))
+    self.metrics.append(metric)
+    return metric
+
+  def Snapshot(self):
+    return dict((metric.name, metric.Snapshot()) for metric in self.metrics)
+
+  def Render(self):
+    lines = []
+    for metric in self.metrics:
+      lines.extend(metric.Render())
+    return '\n'.join(lines) + '\n'
+
+  def Clear(self):
+    for metric in self.metrics:
+      metric.Clear()
+
+
+REGISTRY = Registry()
+
+BYTES_SENT = REGISTRY.Register(Counter(
+    'panacontrol_bytes_sent_total', 'Bytes written to the port.', ('port',)))
+BYTES_RECEIVED = REGISTRY.Register(Counter(
+    'panacontrol_bytes_received_total', 'Bytes read from the port.',
+    ('port',)))
+FRAMES_SENT = REGISTRY.Register(Counter(
+    'panacontrol_frames_sent_total', 'Command frames written to the port.',
+    ('port',)))
+FRAMES_RECEIVED = REGISTRY.Register(Counter(
+    'panacontrol_frames_received_total', 'Frames read from the port.',
+    ('port',)))
+DISCARDED_BYTES = REGISTRY.Register(Counter(
+    'panacontrol_discarded_bytes_total',
+    'Received bytes that were not part of any frame.', ('port',)))
+DECODE_FAILURES = REGISTRY.Register(Counter(
+    'panacontrol_decode_failures_total',
+    'Received frames matching no reply format.', ('port',)))
+CAMERA_ERRORS = REGISTRY.Register(Counter(
+    'panacontrol_camera_errors_total', 'Error replies such as ER3.',
+    ('port', 'error')))
+TIMEOUTS = REGISTRY.Register(Counter(
+    'panacontrol_timeouts_total', 'Commands that got no reply in time.',
+    ('port', 'command')))
+ROUND_TRIP = REGISTRY.Register(Histogram(
+    'panacontrol_round_trip_seconds',
+    'Time from writing a command to receiving its reply.',
+    ('port', 'command')))
+QUEUE_DEPTH = REGISTRY.Register(Gauge(
+    'panacontrol_send_queue_depth',
+    'Commands waiting to be sent or for their reply.', ('port',)))
+
+
+def Snapshot():
+  """Return a dict of metric name to its values, see _Metric.Snapshot."""
+  return REGISTRY.Snapshot()
+
+
+def Render():
+  """Return every metric in the Prometheus text exposition format."""
+  return REGISTRY.Render()
+
+
+def Serve(port=9100, host='127.0.0.1'):
+  """Serve Render() at http://host:port/metrics from a daemon thread.
+
+  Returns the server; call its shutdown() method to stop it.
+  """
+  try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+  except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+  class Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+      if self.path.split('?')[0] != '/metrics':
+        self.send_error(404)
+        return
+      body = Render().encode('utf-8')
+      self.send_response(200)
+      self.send_header('Content-Type', 'text/plain; version=0.0.4')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def log_message(self, *args):
+      pass
+
+  server = HTTPServer((host, port), Handler)
+  thread = threading.Thread(target=server.serve_forever, name='metrics')
+  thread.daemon = True
+  thread.start()
+  return server
@@ -0,0 +1,191 @@
+#!/usr/bin/python3
+"""Drive many HE100 cameras, each on its own serial port, from one process.
+
+Usage: multicam.py <tty> [<tty> ...]
+"""
+
+import asyncio
+import collections
+import sys
+import time
+
+import he100client
+
+
+class LatencyStats(object):
+  """Running reply latency figures for one camera, in seconds."""
+
+  def __init__(self):
+    self.count = 0
+    self.total = 0.0
+    self.last = None
+    self.min = None
+    self.max = None
+
+  def Add(self, latency):
+    self.count += 1
+    self.total += latency
+    self.last = latency
+    if self.min is None or latency < self.min:
+      self.min = latency
+    if self.max is None or latency > self.max:
+      self.max = latency
+
+  @property
+  def mean(self):
+    if not self.count:
+      return None
+    return self.total / self.count
+
+  def __repr__(self):
+    if not self.count:
+      return 'LatencyStats(empty)'
+    return 'LatencyStats(n=%d last=%.1fms mean=%.1fms max=%.1fms)' % (
+        self.count, self.last * 1e3, self.mean * 1e3, self.max * 1e3)
+
+
+class Camera(object):
+  """A camera whose commands go straight to its client's scheduler.
+
+  Commands are not held back behind the replies of earlier ones, so a stop
+  overtakes queued queries as the client allows. written holds the time
+  each encoded command was last written to the port.
+  """
+
+  def __init__(self, name, client):
+    self.name = name
+    self.client = client
+    self.latency = LatencyStats()
+    self.written = {}
+    client.AddWriteListener(self._Written)
+
+  def _Written(self, frame, data):
+    if len(self.written) >= 256 and data not in self.written:
+      self.written.clear()  # Absolute moves each have their own encoding.
+    self.written[data] = time.monotonic()
+
+  def Put(self, frame, data):
+    """Hand an encoded command to the client; returns a future for its reply."""
+    return asyncio.ensure_future(self._Send(frame, data))
+
+  async def _Send(self, frame, data):
+    result = await self.client.Send(frame, data)
+    if frame.reply_format and data in self.written:
+      self.latency.Add(time.monotonic() - self.written[data])
+    return result
+
+  async def Close(self):
+    self.client.RemoveWriteListener(self._Written)
+    self.client.Close()
+
+
+class MultiCameraController(object):
+  """Fans commands out to groups of cameras.
+
+  A command for a group is encoded once and handed to every camera's client
+  in the same pass. Clients with an idle link all write it in the same loop
+  iteration, so the cameras receive it within well under a millisecond of
+  each other. last_skew holds the spread of the times the latest fan out
+  was written to each port.
+  """
+
+  def __init__(self, camera=he100client.HE100, timeout=1.0):
+    self.camera = camera
+    self.timeout = timeout
+    self.cameras = collections.OrderedDict()
+    self.last_skew = None
+
+  async def Open(self, name, tty_name, **kwargs):
+    """Open tty_name as camera name; keyword arguments go to SerialPort."""
+    client = await he100client.Connect(tty_name, self.camera, self.timeout,
+                                       **kwargs)
+    return self.Add(name, client)
+
+  def Add(self, name, client):
+    if name in self.cameras:
+      raise ValueError('Duplicate camera %r' % (name,))
+    camera = self.cameras[name] = Camera(name, client)
+    return camera
+
+  def _Group(self, names):
+    if names is None:
+      return list(self.cameras.values())
+    return [self.cameras[name] for name in names]
+
+  async def Send(self, name, frame, args=(), kind='control'):
+    """Queue one command on one camera and return its reply arguments."""
+    frame, data = self._Encode(frame, args, kind)
+    return await self.cameras[name].Put(frame, data)
+
+  async def FanOut(self, frame, args=(), names=None, kind='control'):
+    """Send one command to every camera in names (default all).
+
+    Returns a dict of camera name to reply arguments, or to the exception
+    raised for that camera.
+    """
+    frame, data = self._Encode(frame, args, kind)
+    group = self._Group(names)
+    futures = [camera.Put(frame, data) for camera in group]
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    sent = [camera.written[data] for camera in group
+            if data in camera.written]
+    if sent:
+      self.last_skew = max(sent) - min(sent)
+    return collections.OrderedDict(
+        (camera.name, result) for camera, result in zip(group, results))
+
+  async def Move(self, pan, tilt, zoom='50', names=None):
+    """Start the same pan, tilt and zoom speeds on a group of cameras."""
+    frames = [(self.camera.Find('pan speed'), pan),
+              (self.camera.Find('tilt speed'), tilt),
+              (self.camera.Find('zoom speed'), zoom)]
+    for frame, value in frames:
+      await self.FanOut(frame, value, names)
+
+  async def Stop(self, names=None):
+    await self.Move('50', '50', '50', names)
+
+  def _Encode(self, frame, args, kind):
+    frame = self.camera.Resolve(frame, kind)
+    if kind == 'confirm':
+      return frame, frame.EncodeConfirmationBytes(args)
+    return frame, frame.EncodeControlBytes(args)
+
+  def Latencies(self):
+    """Return a dict of camera name to its LatencyStats."""
+    return collections.OrderedDict(
+        (name, camera.latency) for name, camera in self.cameras.items())
+
+  async def Close(self):
+    for camera in self.cameras.values():
+      await camera.Close()
+    self.cameras.clear()
+
+
+async def _Main(tty_names):
+  controller = MultiCameraController()
+  for tty_name in tty_names:
+    await controller.Open(tty_name, tty_name)
+  try:
+    for name, result in (await controller.FanOut(
+        'model number', kind='confirm')).items():
+      print('%s: %s' % (name, result))
+    await controller.Move('60', '50')
+    await asyncio.sleep(1)
+    await controller.Stop()
+    print('Write skew %.3fms' % (controller.last_skew * 1e3,))
+    for name, stats in controller.Latencies().items():
+      print('%s: %r' % (name, stats))
+  finally:
+    await controller.Close()
+
+
+def main():
+  if len(sys.argv) < 2:
+    print(__doc__.strip())
+    sys.exit(1)
+  asyncio.run(_Main(sys.argv[1:]))
+
+
+if __name__ == '__main__':
+  main()
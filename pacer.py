@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+"""Spacing between commands on one link, adapted to how the camera copes."""
+
+
+class Pacer(object):
+  """Holds the gap to leave after each command, on top of its link time.
+
+  Every reply or ACK takes decrease of the gap away (at least step), down
+  to min_gap, and every busy/error reply (ER3) or unanswered control
+  command multiplies it by backoff, up to max_gap, and holds off sending
+  for the new gap. A few good replies undo a backoff, so one bad moment
+  does not slow the link for long.
+
+  The gap never shrinks below the average reply time divided by depth, so
+  that about depth commands are with the camera at once however many the
+  client's window allows. As the gap counts from each write, this costs
+  nothing while only one command is outstanding, and as the camera's
+  replies slow down when it queues commands, the gap follows.
+
+  Failed commands are retried up to retries times each, while the budget
+  allows: each retry costs a token and each success earns retry_ratio of
+  one, up to max_tokens, so retries stay a bounded share of the traffic
+  even when the camera keeps refusing.
+  """
+
+  def __init__(self, gap=0.0, min_gap=0.0, max_gap=1.0, step=0.001,
+               backoff=2.0, decrease=0.1, retries=3, retry_ratio=0.1,
+               max_tokens=10.0, depth=4):
+    self.gap = gap
+    self.min_gap = min_gap
+    self.max_gap = max_gap
+    self.step = step
+    self.backoff = backoff
+    self.decrease = decrease
+    self.retries = retries
+    self.retry_ratio = retry_ratio
+    self.max_tokens = max_tokens
+    self.depth = depth
+    self.tokens = max_tokens
+    self.latency = None
+    self.busy = 0
+    self.retried = 0
+
+  def OnReply(self, latency=None):
+    """Note a command answered in time; latency in seconds if known."""
+    self.tokens = min(self.max_tokens, self.tokens + self.retry_ratio)
+    if latency is not None:
+      if self.latency is None:
+        self.latency = latency
+      else:
+        self.latency += (latency - self.latency) / 8.0
+    self.gap = max(self.min_gap, self.floor,
+                   self.gap - max(self.step, self.gap * self.decrease))
+    return self.gap
+
+  @property
+  def floor(self):
+    """The smallest gap the measured reply time allows."""
+    if self.latency is None:
+      return 0.0
+    return min(self.max_gap, self.latency / self.depth)
+
+  def OnBusy(self):
+    """Note an ER3 reply or an unanswered command; returns the new gap."""
+    self.busy += 1
+    self.gap = min(self.max_gap, max(self.step, self.gap * self.backoff))
+    return self.gap
+
+  def Retry(self, attempts):
+    """Return whether a command already sent attempts times may go again."""
+    if attempts > self.retries or self.tokens < 1:
+      return False
+    self.tokens -= 1
+    self.retried += 1
+    return True
@@ -20,62 +20,160 @@
 #  <serial>: serial device camera controller is on, default /dev/ttyUSB0
 #  <joystick>: joystick number if multiple, default 0 
 
-import fcntl
-import struct
+from __future__ import print_function
+
 import sys
-import termios
 import time
-import os
 import pygame
-from numpy import interp
-
-class SerialPort(object):
-    def __init__(self, tty_name):
-        self.tty_name = tty_name
-        self.tty = None
-        self.old_termios = None
-        self.InitTTY()
-
-    def __del__(self):
-        if self.tty and self.old_termios:
-            fd = self.tty.fileno()
-            termios.tcsetattr(fd, termios.TCSAFLUSH, self.old_termios)
-
-    def InitTTY(self):
-        ttyfd = os.open(self.tty_name, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
-        fcntl.fcntl(ttyfd, fcntl.F_SETFL, 0)
-        self.tty = os.fdopen(ttyfd, 'rb+', 0)
-
-        fd = self.tty.fileno()
-
-        self.old_termios = termios.tcgetattr(fd)
-        new_termios = [termios.IGNPAR,                 # iflag
-                       0,                              # oflag
-                       termios.B9600 | termios.CS8 |
-                       termios.CLOCAL | termios.CREAD, # cflag
-                       0,                              # lflag
-                       termios.B9600,                  # ispeed
-                       termios.B9600,                  # ospeed
-                       self.old_termios[6]             # special characters
-                       ]
-        termios.tcsetattr(fd, termios.TCSANOW, new_termios)
-
-        control = fcntl.ioctl(fd, termios.TIOCMGET, struct.pack('I', 0))
-        print '%04X' % struct.unpack('I',control)[0]
-        fcntl.ioctl(fd, termios.TIOCMBIC, struct.pack('I', termios.TIOCM_RTS))
-        fcntl.ioctl(fd, termios.TIOCMBIC, struct.pack('I', termios.TIOCM_DTR))
-        control = fcntl.ioctl(fd, termios.TIOCMGET, struct.pack('I', 0))
-        print '%04X' % struct.unpack('I',control)[0]
-
-    def ReadByte(self):
-        return self.tty.read(1)
-
-    def WriteByte(self, byte):
-        return self.tty.write(byte)
 
-def main():
-    input_buffer = []
+from serialport import SerialPort
+
+# Fraction of the stick travel around the centre that means stop.
+DEADBAND = 0.08
+# How far (in speed steps) the stick must move past a step boundary, the dead
+# band's edge included, before a new speed is sent, so a stick resting on a
+# boundary does not flap.
+HYSTERESIS = 0.35
+# Extra copies of a stop command, sent MIN_INTERVAL apart.
+STOP_REPEATS = 2
+# Minimum time between two speed commands for the same axis, in seconds.
+MIN_INTERVAL = 0.03
+# Focus step repeat rate while a focus button is held, in seconds.
+FOCUS_REPEAT = 0.1
+# How often input-to-write latency is reported, in seconds.
+REPORT_INTERVAL = 5.0
+
+PAN_AXIS = 0
+TILT_AXIS = 1
+ZOOM_AXIS = 3
+FOCUS_UP_BUTTON = 4
+FOCUS_DOWN_BUTTON = 6
+FORMAT_BUTTON = 12
+FOCUS_TOGGLE_BUTTON = 13
+SCALE_BUTTON = 14
+
+_Now = getattr(time, 'monotonic', time.time)
+
+
+class AxisOutput(object):
+    """Turns a joystick axis into camera speed commands, sending only changes.
+
+    The axis is quantized to the camera's 01-99 speed steps, 50 being stop.
+    A new speed is only sent when the quantized value changes, and at most
+    once per min_interval. Stop is sent as soon as the stick returns to the
+    centre and repeated stop_repeats times in case a frame is lost.
+    """
+    STOP = 50
+
+    def __init__(self, command, reverse=False, deadband=DEADBAND,
+                 hysteresis=HYSTERESIS, stop_repeats=STOP_REPEATS,
+                 min_interval=MIN_INTERVAL):
+        self.command = command
+        self.reverse = reverse
+        self.deadband = deadband
+        self.hysteresis = hysteresis
+        self.stop_repeats = stop_repeats
+        self.min_interval = min_interval
+        self.target = self.STOP
+        self.value = None
+        self.sent_at = None
+        self.changed_at = None
+        self._stops_left = 0
+        self._frames = [('%s%02d\r' % (command, value)).encode('latin-1')
+                        for value in range(100)]
+
+    def Quantize(self, position, scale=1):
+        """Return (speed step, exact step) for an axis position in -1..1.
+
+        Inside the dead band the exact step still grows from the centre
+        towards the first step at the dead band's edge.
+        """
+        position = max(-1.0, min(1.0, position * scale))
+        if self.reverse:
+            position = -position
+        magnitude = abs(position)
+        exact = 1 + 48 * (magnitude - self.deadband) / (1 - self.deadband)
+        if magnitude <= self.deadband:
+            step, exact = 0, max(0.0, exact)
+        else:
+            step = int(round(exact))
+        if position < 0:
+            return self.STOP - step, self.STOP - exact
+        return self.STOP + step, self.STOP + exact
+
+    def SetPosition(self, position, scale=1, now=None):
+        """Track a new axis position; now is when the input arrived."""
+        value, exact = self.Quantize(position, scale)
+        if value == self.target:
+            return
+        # The dead band's edge lies one step from stop, other boundaries
+        # half a step from each speed.
+        offset = abs(exact - self.STOP)
+        if self.target == self.STOP:
+            if offset < 1 + self.hysteresis:
+                return
+        elif value == self.STOP:
+            if offset > 1 - self.hysteresis:
+                return
+        elif abs(exact - self.target) < 0.5 + self.hysteresis:
+            return
+        self.target = value
+        if self.changed_at is None:
+            self.changed_at = _Now() if now is None else now
+
+    def Deadline(self):
+        """Return when the next command is due, or None if nothing is."""
+        if self.value is None:
+            return 0
+        if self.target == self.value:
+            if self.target != self.STOP or not self._stops_left:
+                return None
+        elif self.target == self.STOP:
+            return self.sent_at
+        return self.sent_at + self.min_interval
+
+    def Take(self, now):
+        """Return the frame due at now, or None.
+
+        changed_at is left at the time of the input the frame answers.
+        """
+        deadline = self.Deadline()
+        if deadline is None or deadline > now:
+            return None
+        if self.target == self.STOP:
+            if self.value != self.STOP:
+                self._stops_left = self.stop_repeats
+            else:
+                self._stops_left -= 1
+        self.value = self.target
+        self.sent_at = now
+        return self._frames[self.value]
+
 
+class LatencyStats(object):
+    """Input-to-write latency figures, in seconds."""
+
+    def __init__(self):
+        self.Reset()
+
+    def Reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def Add(self, latency):
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def __str__(self):
+        if not self.count:
+            return 'no commands'
+        return '%d commands, latency mean %.1fms max %.1fms' % (
+            self.count, self.total / self.count * 1e3, self.max * 1e3)
+
+
+def main():
     try:
         tty_name = sys.argv[1]
     except IndexError:
@@ -87,92 +185,109 @@ def main():
         joystickno = 0
 
     port = SerialPort(tty_name)
-    pygame.init()                                                                   
-    pygame.joystick.init()                                                          
-    joystick = pygame.joystick.Joystick(joystickno)                                          
-    joystick.init() 
-
-    panno = 50 
-    tiltno = 50
-    zoomno = 50
+    pygame.init()
+    pygame.joystick.init()
+    joystick = pygame.joystick.Joystick(joystickno)
+    joystick.init()
+
+    pan = AxisOutput('#P')
+    tilt = AxisOutput('#T', reverse=True)
+    zoom = AxisOutput('#Z', reverse=True)
+    outputs = (pan, tilt, zoom)
     focusno = 50 # TODO: implement reading current focus, particularly after autofocus enabled
     pantiltscale = 1
     manualfocus = 0
     #vformatno = 2 # 720/50p
     vformatno = 0 # 720/60p
+    focusstep = 0
+    focusdeadline = None
+    latency = LatencyStats()
+    reportdeadline = _Now() + REPORT_INTERVAL
 
-    while True:
-
-        pan = '#P%02d' % panno
-        tilt = '#T%02d' % tiltno
-        zoom = '#Z%02d' % zoomno
-        focus = '#AYF%03d' % focusno
-        focustoggle = '#D1%01d' % manualfocus
-        vformat = '#OSA:87:%01d' % vformatno 
+    def ApplyAxes(now):
+        pan.SetPosition(joystick.get_axis(PAN_AXIS), pantiltscale, now)
+        tilt.SetPosition(joystick.get_axis(TILT_AXIS), 0.75*pantiltscale, now)
+        zoom.SetPosition(joystick.get_axis(ZOOM_AXIS), 1, now)
 
-        for i in (pan, tilt, zoom):
-            port.WriteByte(i)
-            port.WriteByte('\r')
-
-        if manualfocus == 1:
-            port.WriteByte(focus)
-            port.WriteByte('\r')
+    while True:
+        deadlines = [output.Deadline() for output in outputs]
+        deadlines += [focusdeadline, reportdeadline]
+        timeout = min(d for d in deadlines if d is not None) - _Now()
+        events = []
+        if timeout > 0:
+            # A zero timeout would make pygame wait forever.
+            events.append(pygame.event.wait(max(1, int(timeout * 1000))))
+        events += pygame.event.get()
+        now = _Now()
 
-        time.sleep(0.1)
-        pygame.event.wait()
+        frames = []
+        for event in events:
+            if event.type == pygame.QUIT:
+                port.WriteFrames((b'#P50\r', b'#T50\r', b'#Z50\r'), drain=True)
+                return
+            elif event.type == pygame.JOYAXISMOTION:
+                ApplyAxes(now)
+            elif event.type == pygame.JOYBUTTONDOWN:
+                if event.button == SCALE_BUTTON:
+                    if pantiltscale == 1:
+                        pantiltscale = 0.65
+                    elif pantiltscale == 0.65:
+                        pantiltscale = 0.35
+                    elif pantiltscale == 0.35:
+                        pantiltscale = 1
+                    ApplyAxes(now)
+                elif event.button == FOCUS_TOGGLE_BUTTON:
+                    print("Focus Toggle")
+                    frames.append(b'#D1%01d\r' % manualfocus)
+                    manualfocus = 1 - manualfocus
+                    if manualfocus == 1:
+                        frames.append(b'#AYF%03d\r' % focusno)
+                elif event.button == FORMAT_BUTTON:
+                    print("Changing format")
+                    frames.append(b'#OSA:87:%01d\r' % vformatno)
+                    if vformatno == 2:
+                        vformatno = 5 #1080/50i
+                    else:
+                        vformatno = 0
+                elif event.button == FOCUS_UP_BUTTON:
+                    focusstep = 10
+                    focusdeadline = now
+                elif event.button == FOCUS_DOWN_BUTTON:
+                    focusstep = -10
+                    focusdeadline = now
+            elif event.type == pygame.JOYBUTTONUP:
+                if event.button in (FOCUS_UP_BUTTON, FOCUS_DOWN_BUTTON):
+                    focusstep = 0
+                    focusdeadline = None
 
-        def ConvRange(value, reverse=False, scale=1):
-            if reverse == True:
-                camerarange = [99, 1]
-            else:
-                camerarange = [1, 99]
-            joystickrange = [-1, 1]
-            return interp(value*scale, joystickrange, camerarange)
-
-        panno = ConvRange(joystick.get_axis(0), scale=pantiltscale)
-        tiltno = ConvRange(joystick.get_axis(1), reverse=True, scale=0.75*pantiltscale)  
-        zoomno = ConvRange(joystick.get_axis(3), reverse=True)
-
-        if joystick.get_button(14):
-            if pantiltscale == 1:
-                pantiltscale = 0.65
-            elif pantiltscale == 0.65:
-                pantiltscale = 0.35
-            elif pantiltscale == 0.35:
-                pantiltscale = 1 
-                while joystick.get_button(14) == 1: 
-                    pygame.event.pump()
-
-        if joystick.get_button(13):
-            print "Focus Toggle"
-            if manualfocus == 1:
-                manualfocus = 0
-            else:
-                manualfocus = 1
-            port.WriteByte(focustoggle)
-            port.WriteByte('\r')
-            while joystick.get_button(13) == 1:
-                pygame.event.pump()
-
-        if joystick.get_button(12):
-            print "Changing format"
-            if vformatno == 2:
-                vformatno = 5 #1080/50i
-            else:
-                vformatno = 0
-            port.WriteByte(vformat)
-            port.WriteByte('\r')
+        if focusdeadline is not None and focusdeadline <= now:
+            if ((focusstep > 0 and not focusno > 999) or
+                    (focusstep < 0 and not focusno < 1)):
+                focusno = focusno + focusstep
+                if manualfocus == 1:
+                    frames.append(b'#AYF%03d\r' % focusno)
+            focusdeadline = now + FOCUS_REPEAT
 
-        if joystick.get_button(4):
-            if not focusno > 999:
-                focusno = focusno + 10 
+        inputs = []
+        for output in outputs:
+            frame = output.Take(now)
+            if frame:
+                frames.append(frame)
+                inputs.append(output.changed_at)
+                output.changed_at = None
 
-        if joystick.get_button(6):
-            if not focusno < 1:
-                focusno = focusno - 10
+        if frames:
+            port.WriteFrames(frames)
+            written = _Now()
+            for changed_at in inputs:
+                if changed_at is not None:
+                    latency.Add(written - changed_at)
 
-        print pan, tilt, zoom, focus, manualfocus
+        if now >= reportdeadline:
+            print(pan.value, tilt.value, zoom.value, focusno, manualfocus)
+            print(latency)
+            latency.Reset()
+            reportdeadline = now + REPORT_INTERVAL
 
 if __name__ == '__main__':
     main()
-
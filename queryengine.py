@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+"""Read many camera parameters with several queries in flight at once.
+
+Usage: queryengine.py <tty> [<window>]
+"""
+
+import asyncio
+import collections
+import sys
+import time
+
+import he100client
+
+
+class QueryEngine(object):
+  """Issues confirm commands through a client, window of them at a time.
+
+  Replies are matched to their queries by the client through the reply
+  formats of the command table, so the camera is kept busy instead of the
+  link idling for a full round trip per parameter. A query answered with an
+  error reply or not answered within the timeout only fails that query.
+  """
+
+  def __init__(self, client, window=8):
+    self.client = client
+    self.client.window = window
+    self.elapsed = None
+
+  def Readable(self):
+    """Return every frame of the client's table that can be queried."""
+    return [frame for frame in self.client.camera.commands
+            if frame.confirm_format and frame.reply_format]
+
+  async def Query(self, frames, timeout=None):
+    """Confirm every frame (or description) in frames.
+
+    Returns an OrderedDict of frame to reply arguments, or to the CameraError
+    or asyncio.TimeoutError raised for that query.
+    """
+    frames = [self.client.Resolve(frame, 'confirm') for frame in frames]
+    start = time.monotonic()
+    results = await asyncio.gather(
+        *[self.client.Confirm(frame, timeout=timeout) for frame in frames],
+        return_exceptions=True)
+    self.elapsed = time.monotonic() - start
+    return collections.OrderedDict(zip(frames, results))
+
+  async def ReadAll(self, timeout=None):
+    """Query every readable parameter of the camera."""
+    return await self.Query(self.Readable(), timeout)
+
+
+async def _Main(tty_name, window):
+  client = await he100client.Connect(tty_name)
+  try:
+    engine = QueryEngine(client, window)
+    for frame, result in (await engine.ReadAll()).items():
+      if isinstance(result, Exception):
+        result = 'failed (%s)' % (type(result).__name__,)
+      print('%-24s %s' % (frame.desc, result))
+    print('Read in %.2fs with a window of %d' % (engine.elapsed, window))
+  finally:
+    client.Close()
+
+
+def main():
+  if len(sys.argv) < 2:
+    print(__doc__.strip())
+    sys.exit(1)
+  try:
+    window = int(sys.argv[2])
+  except IndexError:
+    window = 8
+  asyncio.run(_Main(sys.argv[1], window))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+"""Orders commands waiting for one serial link by urgency.
+
+Classes, most urgent first: STOP (a speed of 50, i.e. stop that axis),
+MOTION (speeds and absolute moves), CONTROL (other settings) and QUERY
+(confirm commands).
+"""
+
+import collections
+import time
+
+STOP, MOTION, CONTROL, QUERY = range(4)
+NAMES = ('stop', 'motion', 'control', 'query')
+
+SPEEDS = ('pan speed', 'tilt speed', 'zoom speed', 'focus speed', 'iris',
+          'roll speed')
+MOTION_COMMANDS = SPEEDS + ('pan/tilt position', 'zoom position x',
+                            'focus position x', 'focus position y', 'iris x')
+
+# Commands that act rather than set a value, so two of them in a row are not
+# the same as the second alone.
+ACTIONS = ('save preset memory', 'recall preset memory', 'scene file',
+           'power')
+
+
+def Classify(frame, args):
+  """Return the class of frame sent with control args (None for a query)."""
+  if args is None:
+    return QUERY
+  if frame.desc in SPEEDS and args and args[0] == '50':
+    return STOP
+  if frame.desc in MOTION_COMMANDS:
+    return MOTION
+  return CONTROL
+
+
+class Entry(object):
+  """A command waiting to be written, and everyone waiting for its reply."""
+
+  __slots__ = ('frame', 'data', 'priority', 'key', 'queued', 'timeout',
+               'waiters', 'attempts')
+
+  def __init__(self, frame, data, priority, key, queued, timeout):
+    self.frame = frame
+    self.data = data
+    self.priority = priority
+    self.key = key
+    self.queued = queued
+    self.timeout = timeout
+    self.waiters = []
+    self.attempts = 0
+
+  @property
+  def expects_reply(self):
+    return bool(self.frame.reply_format)
+
+
+class SendScheduler(object):
+  """Priority queues with latest-wins coalescing and bounded starvation.
+
+  Putting a command for a frame that already has a command of the same kind
+  queued replaces the queued bytes instead of adding another entry, so a
+  burst of joystick speeds costs one write, and both callers get the reply
+  of the one that is sent. The entry keeps its place and takes the more
+  urgent class of the two, so a stop never waits behind what it replaced.
+  Queries coalesce only when their bytes are identical, and ACTIONS never.
+
+  Entries are normally taken most urgent first, but one that has waited
+  longer than starvation seconds goes before any newer, more urgent one,
+  except a stop, which always goes first.
+  """
+
+  def __init__(self, starvation=1.0, clock=time.monotonic):
+    self.starvation = starvation
+    self.clock = clock
+    self.coalesced = 0
+    self._queues = [collections.deque() for _ in NAMES]
+    self._keys = {}
+
+  def __len__(self):
+    return sum(len(queue) for queue in self._queues)
+
+  def Depths(self):
+    """Return a dict of class name to the number of queued entries."""
+    return dict(zip(NAMES, [len(queue) for queue in self._queues]))
+
+  def Put(self, frame, data, priority, timeout=None):
+    """Queue data for frame and return its Entry, which may be shared."""
+    if priority == QUERY:
+      key = (frame, data)
+    elif frame.desc in ACTIONS:
+      key = None
+    else:
+      key = (frame, 'control')
+    entry = self._keys.get(key) if key is not None else None
+    if entry is not None:
+      self.coalesced += 1
+      entry.data = data
+      entry.timeout = timeout
+      if priority < entry.priority:
+        self._queues[entry.priority].remove(entry)
+        entry.priority = priority
+        self._Insert(entry)
+      return entry
+
+    entry = Entry(frame, data, priority, key, self.clock(), timeout)
+    self._queues[priority].append(entry)
+    if key is not None:
+      self._keys[key] = entry
+    return entry
+
+  def Requeue(self, entry):
+    """Queue a popped entry again, e.g. to retry it, in its old place.
+
+    If a newer command for the same frame was queued meanwhile it wins, and
+    entry's waiters get its reply instead.
+    """
+    newer = self._keys.get(entry.key) if entry.key is not None else None
+    if newer is not None:
+      newer.waiters.extend(entry.waiters)
+      return newer
+    self._Insert(entry)
+    if entry.key is not None:
+      self._keys[entry.key] = entry
+    return entry
+
+  def _Insert(self, entry):
+    """Put entry in its class queue in the order it was first queued."""
+    queue = self._queues[entry.priority]
+    index = len(queue)
+    while index and queue[index - 1].queued > entry.queued:
+      index -= 1
+    queue.insert(index, entry)
+
+  def Pop(self, replies=True, stops_only=False):
+    """Remove and return the next entry to write, or None.
+
+    With replies false only entries that expect no reply are considered,
+    for when no more replies can be outstanding, and with stops_only only
+    STOP entries, for while everything else is held back.
+    """
+    deadline = self.clock() - self.starvation
+    best = None
+    for queue in self._queues[:STOP + 1] if stops_only else self._queues:
+      for entry in queue:
+        if replies or not entry.expects_reply:
+          break
+      else:
+        continue
+      if best is None:
+        best = entry
+      elif (best.priority != STOP and entry.queued <= deadline and
+            entry.queued < best.queued):
+        best = entry
+    if best is not None:
+      self._queues[best.priority].remove(best)
+      if best.key is not None:
+        del self._keys[best.key]
+    return best
+
+  def Clear(self):
+    """Remove and return every queued entry."""
+    entries = [entry for queue in self._queues for entry in queue]
+    for queue in self._queues:
+      queue.clear()
+    self._keys.clear()
+    return entries
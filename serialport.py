@@ -0,0 +1,188 @@
+#!/usr/bin/python
+"""Raw serial port access shared by the camera and converter scripts."""
+
+import fcntl
+import os
+import select
+import struct
+import termios
+import time
+
+import metrics
+
+_Now = getattr(time, 'monotonic', time.time)
+
+
+class ReadTimeout(IOError):
+  """No terminator arrived before the deadline."""
+
+
+def _ToBytes(data):
+  """Return data as something os.write() accepts, encoding str as latin-1."""
+  if isinstance(data, bytes):
+    return data
+  if isinstance(data, bytearray):
+    return bytes(data)
+  return data.encode('latin-1')
+
+
+class SerialPort(object):
+  def __init__(self, tty_name, baudrate=9600, clear_modem_lines=True):
+    self.tty_name = tty_name
+    self.baudrate = baudrate
+    self.clear_modem_lines = clear_modem_lines
+    self.tty = None
+    self.old_termios = None
+    self._pending = b''
+    self.InitTTY()
+
+  def __del__(self):
+    self.Close()
+
+  def Close(self):
+    if self.tty and self.old_termios:
+      fd = self.tty.fileno()
+      try:
+        termios.tcsetattr(fd, termios.TCSAFLUSH, self.old_termios)
+      except termios.error:
+        pass  # The device went away, e.g. a simulator's pty was closed.
+      self.old_termios = None
+    if self.tty:
+      self.tty.close()
+      self.tty = None
+
+  def fileno(self):
+    return self.tty.fileno()
+
+  def InitTTY(self):
+    ttyfd = os.open(self.tty_name, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    fcntl.fcntl(ttyfd, fcntl.F_SETFL, 0)
+    self.tty = os.fdopen(ttyfd, 'rb+', 0)
+
+    fd = self.tty.fileno()
+    speed = getattr(termios, 'B%d' % self.baudrate)
+
+    self.old_termios = termios.tcgetattr(fd)
+    cc = list(self.old_termios[6])
+    # read() returns whatever is available as soon as there is a byte.
+    cc[termios.VMIN] = 1
+    cc[termios.VTIME] = 0
+    new_termios = [termios.IGNPAR,                 # iflag
+                   0,                              # oflag
+                   speed | termios.CS8 |
+                   termios.CLOCAL | termios.CREAD, # cflag
+                   0,                              # lflag
+                   speed,                          # ispeed
+                   speed,                          # ospeed
+                   cc                              # special characters
+                  ]
+    termios.tcsetattr(fd, termios.TCSANOW, new_termios)
+
+    if self.clear_modem_lines:
+      try:
+        fcntl.ioctl(fd, termios.TIOCMBIC, struct.pack('I', termios.TIOCM_RTS))
+        fcntl.ioctl(fd, termios.TIOCMBIC, struct.pack('I', termios.TIOCM_DTR))
+      except IOError:
+        # Pseudo terminals have no modem lines.
+        pass
+
+  def ReadByte(self):
+    if self._pending:
+      byte, self._pending = self._pending[:1], self._pending[1:]
+      return byte
+    byte = self.tty.read(1)
+    if metrics.enabled:
+      metrics.BYTES_RECEIVED.Inc((self.tty_name,), len(byte))
+    return byte
+
+  def Read(self, timeout=None, size=4096):
+    """Return everything available, waiting at most timeout seconds.
+
+    Returns an empty string if nothing arrived in time; timeout=None waits
+    forever and timeout=0 only polls.
+    """
+    if self._pending:
+      data, self._pending = self._pending, b''
+      return data
+    if not WaitReadable((self,), timeout):
+      return b''
+    data = os.read(self.tty.fileno(), size)
+    if metrics.enabled:
+      metrics.BYTES_RECEIVED.Inc((self.tty_name,), len(data))
+    return data
+
+  def ReadUntil(self, terminators=(b'\r', b'\x03'), timeout=None):
+    """Return data up to and including the first terminator.
+
+    Raises ReadTimeout if no terminator arrives within timeout seconds. Data
+    received so far is kept for the next call, as is anything after the
+    terminator.
+    """
+    deadline = None if timeout is None else _Now() + timeout
+    data = self._pending
+    self._pending = b''
+    searched = 0
+    while True:
+      end = -1
+      for terminator in terminators:
+        found = data.find(terminator, searched)
+        if found >= 0 and (end < 0 or found < end):
+          end = found
+      if end >= 0:
+        self._pending = data[end + 1:]
+        if metrics.enabled:
+          metrics.FRAMES_RECEIVED.Inc((self.tty_name,))
+        return data[:end + 1]
+      searched = len(data)
+
+      remaining = None
+      if deadline is not None:
+        remaining = max(0, deadline - _Now())
+      chunk = self.Read(remaining)
+      if not chunk:
+        self._pending = data
+        raise ReadTimeout('No terminator from %s' % (self.tty_name,))
+      data += chunk
+
+  def WriteByte(self, byte):
+    return self.tty.write(_ToBytes(byte))
+
+  def WriteFrame(self, frame, drain=False):
+    """Write one encoded frame with a single system call."""
+    self.WriteFrames((frame,), drain)
+
+  def WriteFrames(self, frames, drain=False):
+    """Write encoded frames back to back with a single system call.
+
+    Partial writes are continued until everything has been handed to the
+    kernel. With drain, wait until the data has left the UART as well.
+    """
+    frames = [_ToBytes(frame) for frame in frames]
+    data = b''.join(frames)
+    if metrics.enabled:
+      metrics.FRAMES_SENT.Inc((self.tty_name,), len(frames))
+      metrics.BYTES_SENT.Inc((self.tty_name,), len(data))
+    fd = self.tty.fileno()
+    while data:
+      written = os.write(fd, data)
+      data = data[written:]
+    if drain:
+      termios.tcdrain(fd)
+
+
+def WaitReadable(ports, timeout=None):
+  """Return the subset of ports (anything with fileno()) ready to read."""
+  ports = list(ports)
+  if not hasattr(select, 'poll'):
+    ready, _, _ = select.select(ports, [], [], timeout)
+    return ready
+
+  poller = select.poll()
+  by_fd = {}
+  for port in ports:
+    fd = port.fileno()
+    by_fd[fd] = port
+    poller.register(fd, select.POLLIN | select.POLLPRI)
+  if timeout is not None:
+    timeout = timeout * 1000
+  return [by_fd[fd] for fd, _ in poller.poll(timeout)]
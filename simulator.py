@@ -0,0 +1,413 @@
+#!/usr/bin/python3
+"""Simulated HE100 camera or Gefen converter on a pseudo terminal.
+
+Usage: simulator.py [he100|gefen] [<baudrate>] [<delay ms>]
+       simulator.py http [<port>] [<delay ms>]
+
+Prints the path of the pty to pass to the control scripts, or the port of
+the HTTP interface of a network head, then serves it until interrupted.
+"""
+
+import os
+import select
+import sys
+import threading
+import time
+import tty
+
+try:
+  from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+  from urllib.parse import parse_qs, urlsplit
+except ImportError:
+  pass  # Python 2 has the serial simulator only.
+
+from framing import CCPFrame, Noise, PTFrame, StreamParser
+from he100 import HE100
+
+
+def _Hex(value, width):
+  return b'%0*X' % (width, int(round(value)))
+
+
+class _Axis(object):
+  """One motor: moves at speed (-1..1) of rate units/s, or towards target."""
+
+  def __init__(self, low, high, position, seconds):
+    self.low = low
+    self.high = high
+    self.position = float(position)
+    self.rate = (high - low) / seconds
+    self.speed = 0.0
+    self.target = None
+
+  def SetSpeed(self, speed):
+    self.speed = speed
+    self.target = None
+
+  def SetTarget(self, target):
+    self.speed = 0.0
+    self.target = max(self.low, min(self.high, target))
+
+  @property
+  def moving(self):
+    return self.speed != 0.0 or self.target is not None
+
+  def Advance(self, elapsed):
+    step = self.rate * elapsed
+    if self.target is not None:
+      delta = self.target - self.position
+      if abs(delta) <= step:
+        self.position = self.target
+        self.target = None
+      else:
+        self.position += step if delta > 0 else -step
+    elif self.speed:
+      self.position += self.speed * step
+      self.position = max(self.low, min(self.high, self.position))
+
+
+class HE100Model(object):
+  """Answers HE100 commands from the command table with believable values.
+
+  Speed commands move simulated motors, position queries report where they
+  are, absolute moves and preset recalls travel at full speed, and a
+  preset complete notification is sent when a recall arrives. Everything
+  else is remembered as set, per command as some descs name two, and
+  echoed back.
+  """
+
+  SPEEDS = {'pan speed': 'pan', 'tilt speed': 'tilt', 'zoom speed': 'zoom',
+            'focus speed': 'focus', 'iris': 'iris'}
+
+  def __init__(self, camera=HE100, clock=time.monotonic):
+    self.camera = camera
+    self.clock = clock
+    self.axes = {'pan': _Axis(0x2D09, 0xD2F5, 0x8000, 4.0),
+                 'tilt': _Axis(0x5555, 0x8E38, 0x7FFF, 2.0),
+                 'zoom': _Axis(0x555, 0xFFF, 0x555, 2.0),
+                 'focus': _Axis(0x555, 0xFFF, 0x800, 1.5),
+                 'iris': _Axis(0x555, 0xFFF, 0x800, 1.0)}
+    self.values = {}
+    self.presets = {}
+    self._recalled = None
+    self._control = camera.GetDispatcher('control')
+    self._confirm = camera.GetDispatcher('confirm')
+    self._error = camera.Find('error 3')
+    self._complete = camera.Find('preset complete notification')
+    self._save = camera.Find('save preset memory')
+    self._last = clock()
+
+  def Advance(self):
+    """Move the motors up to now and return any unsolicited replies."""
+    now = self.clock()
+    for axis in self.axes.values():
+      axis.Advance(now - self._last)
+    self._last = now
+    if self._recalled is not None and not any(
+        self.axes[name].moving for name in ('pan', 'tilt', 'zoom', 'focus')):
+      preset, self._recalled = self._recalled, None
+      return [self._complete.EncodeReplyBytes(preset)]
+    return []
+
+  def Handle(self, frame):
+    """Return the replies to a command frame, after any notifications due."""
+    replies = self.Advance()
+    try:
+      command, args = self._control.Decode(frame.raw)
+      control = True
+    except ValueError:
+      try:
+        command, args = self._confirm.Decode(frame.raw)
+        control = False
+      except ValueError:
+        if isinstance(frame, CCPFrame):
+          replies.append(
+              self._error.EncodeReplyBytes(frame.payload[:3].ljust(3)))
+        return replies
+
+    if control:
+      self._Control(command, args)
+    if command.reply_format:
+      replies.append(command.EncodeReplyBytes(self._ReplyArgs(command)))
+    return replies
+
+  def _Control(self, command, args):
+    desc = command.desc
+    axes = self.axes
+    if desc in self.SPEEDS:
+      axes[self.SPEEDS[desc]].SetSpeed((int(args[0]) - 50) / 49.0)
+    elif desc == 'pan/tilt position':
+      axes['pan'].SetTarget(int(args[0], 16))
+      axes['tilt'].SetTarget(int(args[1], 16))
+    elif desc == 'zoom position x':
+      axes['zoom'].SetTarget(int(args[0], 16))
+    elif desc in ('focus position x', 'focus position y'):
+      axes['focus'].SetTarget(int(args[0], 16))
+    elif desc == 'iris x':
+      axes['iris'].SetTarget(int(args[0], 16))
+    elif desc == 'save preset memory':
+      self.presets[args[0]] = dict(
+          (name, axis.position) for name, axis in axes.items())
+    elif desc == 'recall preset memory':
+      for name, position in self.presets.get(args[0], {}).items():
+        axes[name].SetTarget(position)
+      self._recalled = args[0]
+    self.values[command] = args
+
+  def _ReplyArgs(self, command):
+    axes = self.axes
+    desc = command.desc
+    if desc == 'pan/tilt position':
+      return (_Hex(axes['pan'].position, 4), _Hex(axes['tilt'].position, 4))
+    if desc in ('zoom position x', 'request zoom position'):
+      return (_Hex(axes['zoom'].position, 3),)
+    if desc in ('focus position x', 'request focus position'):
+      return (_Hex(axes['focus'].position, 3),)
+    if desc == 'iris x':
+      return (_Hex(axes['iris'].position, 3),)
+    if desc == 'request iris position':
+      return (_Hex(axes['iris'].position, 3), b'0')
+    if desc == 'recall preset memory':
+      command = self._save
+
+    widths = command.Widths()
+    args = self.values.get(command)
+    if args is None or [len(arg) for arg in args] != widths:
+      args = tuple(b'0' * width if width else b'SIM' for width in widths)
+    return args
+
+
+class GefenModel(object):
+  """Answers the Gefen HD-SDI to DVI converter's text commands.
+
+  The reply texts are guesses; each reply is followed by an empty line, as
+  seen from the real device.
+  """
+
+  def __init__(self):
+    self.values = {b'FRAME': b'0', b'OUTPUT': b'0'}
+
+  def Advance(self):
+    return []
+
+  def Handle(self, frame):
+    words = frame.payload.lstrip(b'#').split()
+    if not words:
+      return []
+    command = words[0].upper()
+    if command in self.values:
+      if len(words) > 1:
+        self.values[command] = words[1]
+      reply = command + b' ' + self.values[command]
+    elif command == b'DEVTYPE':
+      reply = b'EXT-HDSDI-2-DVI'
+    elif command == b'DEVERSION':
+      reply = b'1.0'
+    elif command == b'LIST':
+      reply = b'#FRAME #OUTPUT #DEVTYPE #DEVERSION #LIST'
+    else:
+      reply = b'ERROR'
+    return [reply + b'\r', b'\r']
+
+
+class Simulator(object):
+  """Serves a model on a pty, emulating the link speed and processing time.
+
+  Commands are handled one at a time, as a camera would: each takes delay
+  seconds plus the time its bytes and those of its reply spend on a link of
+  the given baud rate (10 bits per byte).
+  """
+
+  def __init__(self, model, baudrate=9600, delay=0.005):
+    self.model = model
+    self.baudrate = baudrate
+    self.delay = delay
+    self.tty_name = None
+    self.commands = 0
+    self._master = None
+    self._slave = None
+    self._stop = None
+    self._thread = None
+
+  def __enter__(self):
+    self.Start()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.Stop()
+
+  def ByteTime(self, count):
+    return count * 10.0 / self.baudrate
+
+  def Start(self):
+    """Open the pty and start serving it; returns the path to open."""
+    self._master, self._slave = os.openpty()
+    tty.setraw(self._slave)
+    self.tty_name = os.ttyname(self._slave)
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._Serve, name='simulator')
+    self._thread.daemon = True
+    self._thread.start()
+    return self.tty_name
+
+  def Stop(self):
+    if self._thread is None:
+      return
+    self._stop.set()
+    self._thread.join()
+    self._thread = None
+    os.close(self._master)
+    os.close(self._slave)
+
+  def _Write(self, replies):
+    for reply in replies:
+      time.sleep(self.ByteTime(len(reply)))
+      os.write(self._master, reply)
+
+  def _Serve(self):
+    parser = StreamParser()
+    while not self._stop.is_set():
+      ready, _, _ = select.select([self._master], [], [], 0.01)
+      self._Write(self.model.Advance())
+      if not ready:
+        continue
+      try:
+        data = os.read(self._master, 4096)
+      except OSError:
+        continue
+      for frame in parser.Feed(data):
+        if isinstance(frame, Noise):
+          continue
+        self.commands += 1
+        time.sleep(self.delay + self.ByteTime(len(frame.raw)))
+        self._Write(self.model.Handle(frame))
+
+
+class HTTPSimulator(object):
+  """Serves an HE100Model the way a network head's CGI interface does.
+
+  /cgi-bin/aw_ptz?cmd=#... takes PT commands and /cgi-bin/aw_cam?cmd=...
+  CCP ones, without framing, and the body of the response is the reply,
+  also without framing. Requests are handled one at a time, each taking
+  delay seconds, over keep-alive HTTP/1.1 connections. Notifications such
+  as preset complete are not delivered, as HTTP has no way to.
+  """
+
+  def __init__(self, model, host='127.0.0.1', port=0, delay=0.005):
+    self.model = model
+    self.host = host
+    self.port = port
+    self.delay = delay
+    self.requests = 0
+    self._lock = threading.Lock()
+    self._server = None
+    self._thread = None
+
+  def __enter__(self):
+    self.Start()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.Stop()
+
+  def Start(self):
+    """Start serving; returns the port."""
+    simulator = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def do_GET(self):
+        url = urlsplit(self.path)
+        cmd = parse_qs(url.query).get('cmd', [''])[0].encode('latin-1')
+        if url.path == '/cgi-bin/aw_ptz':
+          frame = PTFrame(cmd + b'\r')
+        elif url.path == '/cgi-bin/aw_cam':
+          frame = CCPFrame(b'\x02' + cmd + b'\x03')
+        else:
+          self.send_error(404)
+          return
+        body = simulator.Handle(frame)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+          self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+          self.close_connection = True  # The client gave up waiting.
+
+      def log_message(self, *args):
+        pass
+
+    self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+    self._server.daemon_threads = True
+    self.port = self._server.server_address[1]
+    self._thread = threading.Thread(target=self._server.serve_forever,
+                                    name='http simulator')
+    self._thread.daemon = True
+    self._thread.start()
+    return self.port
+
+  def Handle(self, frame):
+    """Return the unframed reply to frame, b'' if there is none."""
+    with self._lock:
+      self.requests += 1
+      time.sleep(self.delay)
+      replies = self.model.Handle(frame)
+    if not replies:
+      return b''
+    reply = replies[-1]
+    return reply[1:-1] if reply.startswith(b'\x02') else reply[:-1]
+
+  def Stop(self):
+    if self._server is None:
+      return
+    self._server.shutdown()
+    self._server.server_close()
+    self._thread.join()
+    self._server = None
+
+
+def main():
+  try:
+    kind = sys.argv[1]
+  except IndexError:
+    kind = 'he100'
+  if kind == 'http':
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+    delay = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.005
+    simulator = HTTPSimulator(HE100Model(), '0.0.0.0', port, delay)
+    print(simulator.Start())
+    try:
+      while True:
+        time.sleep(1)
+    except KeyboardInterrupt:
+      pass
+    simulator.Stop()
+    return
+  if kind == 'he100':
+    model, baudrate = HE100Model(), 9600
+  elif kind == 'gefen':
+    model, baudrate = GefenModel(), 115200
+  else:
+    print(__doc__.strip())
+    sys.exit(1)
+  if len(sys.argv) > 2:
+    baudrate = int(sys.argv[2])
+  delay = 0.005
+  if len(sys.argv) > 3:
+    delay = float(sys.argv[3]) / 1000
+
+  simulator = Simulator(model, baudrate, delay)
+  print(simulator.Start())
+  try:
+    while True:
+      time.sleep(1)
+  except KeyboardInterrupt:
+    pass
+  simulator.Stop()
+
+
+if __name__ == '__main__':
+  main()
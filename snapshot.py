@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+"""Save a camera's settings to a file and bring cameras back to it.
+
+Usage: snapshot.py save <tty> <file>
+       snapshot.py diff <file> <tty>
+       snapshot.py restore <file> <tty> [<tty> ...]
+"""
+
+import asyncio
+import collections
+import json
+import sys
+import time
+
+import he100client
+from scheduler import MOTION_COMMANDS
+from statecache import POSITIONS
+
+FORMAT = 'panacontrol-snapshot'
+VERSION = 1
+
+# Live state rather than setup.
+SKIP = MOTION_COMMANDS + POSITIONS + ('power', 'tally', 'wiper',
+                                      'recall preset memory',
+                                      'save preset memory')
+
+# Selecting a scene file loads a whole set of values, so it goes first and
+# everything else is compared after it. Modes go before the values that
+# only apply in them, and output formats last so the picture changes once.
+FIRST = ('scene file', 'iris auto/manual', 'AWC mode', 'gain up', 'shutter',
+         'detail', 'detail select', 'flare sw', 'zebra indicator')
+LAST = ('aspect ratio', 'output select', 'evf output')
+
+Change = collections.namedtuple('Change', 'command desc old new status')
+
+
+def Settings(camera):
+  """Return the frames of camera's table that a snapshot holds, in order."""
+  frames = [frame for frame in camera.commands
+            if frame.confirm_format and frame.control_format and
+            frame.reply_format and frame.desc not in SKIP]
+
+  def Rank(frame):
+    if frame.desc in FIRST:
+      return 0, FIRST.index(frame.desc)
+    if frame.desc in LAST:
+      return 2, LAST.index(frame.desc)
+    return 1, 0
+
+  return sorted(frames, key=Rank)
+
+
+async def _Read(client, frames):
+  results = await asyncio.gather(*[client.Confirm(frame) for frame in frames],
+                                 return_exceptions=True)
+  return collections.OrderedDict(
+      (frame, list(result)) for frame, result in zip(frames, results)
+      if not isinstance(result, Exception))
+
+
+async def Take(client):
+  """Read every setting from the camera and return a snapshot dict.
+
+  Settings the camera does not answer are left out.
+  """
+  info = await _Read(client, [client.Resolve('model number', 'confirm')])
+  values = await _Read(client, Settings(client.camera))
+  return {'format': FORMAT, 'version': VERSION,
+          'taken': time.strftime('%Y-%m-%dT%H:%M:%S'),
+          'model': ''.join(sum(info.values(), [])),
+          'settings': [{'command': frame.confirm_format, 'desc': frame.desc,
+                        'value': value} for frame, value in values.items()]}
+
+
+def Save(snapshot, path):
+  with open(path, 'w') as f:
+    json.dump(snapshot, f, indent=1)
+    f.write('\n')
+
+
+def Load(path):
+  with open(path) as f:
+    snapshot = json.load(f)
+  if snapshot.get('format') != FORMAT:
+    raise ValueError('%s is not a camera snapshot' % (path,))
+  if snapshot.get('version', 0) > VERSION:
+    raise ValueError('%s is snapshot version %s, newer than %d' %
+                     (path, snapshot.get('version'), VERSION))
+  return snapshot
+
+
+def _Wanted(camera, snapshot):
+  """Return an OrderedDict of frame to saved value, in restore order."""
+  by_command = dict((entry['command'], entry['value'])
+                    for entry in snapshot['settings'])
+  wanted = collections.OrderedDict()
+  for frame in Settings(camera):
+    if frame.confirm_format in by_command:
+      wanted[frame] = by_command[frame.confirm_format]
+  return wanted
+
+
+async def Diff(client, snapshot):
+  """Return a Change for every setting that differs from the snapshot."""
+  wanted = _Wanted(client.camera, snapshot)
+  current = await _Read(client, list(wanted))
+  return [Change(frame.confirm_format, frame.desc, current.get(frame), value,
+                 'differs')
+          for frame, value in wanted.items() if current.get(frame) != value]
+
+
+async def Restore(client, snapshot):
+  """Send only the settings that differ from the snapshot, in a safe order.
+
+  Each control command's reply is compared with the value sent. Returns a
+  Change per setting sent, with status 'set', 'mismatch' (the camera
+  replied with another value) or the error raised.
+  """
+  wanted = _Wanted(client.camera, snapshot)
+  scenes = collections.OrderedDict(
+      (frame, wanted.pop(frame)) for frame in list(wanted)
+      if frame.desc == 'scene file')
+  changes = await _Apply(client, scenes)
+  changes.extend(await _Apply(client, wanted))
+  return changes
+
+
+async def _Apply(client, wanted):
+  current = await _Read(client, list(wanted))
+  changes = []
+  for frame, value in wanted.items():
+    old = current.get(frame)
+    if old == value:
+      continue
+    try:
+      reply = await client.Control(frame, tuple(value))
+    except (he100client.CameraError, asyncio.TimeoutError) as exc:
+      status = '%s: %s' % (type(exc).__name__, exc)
+    else:
+      status = 'set' if list(reply or ()) == value else 'mismatch'
+    changes.append(Change(frame.confirm_format, frame.desc, old, value,
+                          status))
+  return changes
+
+
+async def RestoreAll(clients, snapshot):
+  """Restore one snapshot on many cameras at once; returns name to changes."""
+  names = list(clients)
+  results = await asyncio.gather(
+      *[Restore(clients[name], snapshot) for name in names],
+      return_exceptions=True)
+  return collections.OrderedDict(zip(names, results))
+
+
+async def _Main(command, args):
+  if command == 'save':
+    client = await he100client.Connect(args[0], window=8)
+    try:
+      snapshot = await Take(client)
+    finally:
+      client.Close()
+    Save(snapshot, args[1])
+    print('%d settings saved' % (len(snapshot['settings']),))
+    return
+
+  snapshot = Load(args[0])
+  clients = collections.OrderedDict()
+  for tty_name in args[1:]:
+    clients[tty_name] = await he100client.Connect(tty_name, window=8)
+  try:
+    if command == 'diff':
+      results = collections.OrderedDict()
+      for name, client in clients.items():
+        results[name] = await Diff(client, snapshot)
+    else:
+      results = await RestoreAll(clients, snapshot)
+    for name, changes in results.items():
+      if isinstance(changes, Exception):
+        print('%s: failed (%s)' % (name, changes))
+        continue
+      print('%s: %d changes' % (name, len(changes)))
+      for change in changes:
+        print('  %-8s %-20s %s -> %s %s' % (
+            change.command, change.desc, change.old, change.new,
+            change.status))
+  finally:
+    for client in clients.values():
+      client.Close()
+
+
+def main():
+  if len(sys.argv) < 4 or sys.argv[1] not in ('save', 'diff', 'restore'):
+    print(__doc__.strip())
+    sys.exit(1)
+  asyncio.run(_Main(sys.argv[1], sys.argv[2:]))
+
+
+if __name__ == '__main__':
+  main()
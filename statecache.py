@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+"""Shadow copy of camera parameters, kept up to date from the link."""
+
+import time
+
+POSITIONS = ('pan/tilt position',
+             'zoom position x', 'zoom position y', 'request zoom position',
+             'focus position x', 'focus position y', 'request focus position',
+             'iris x', 'iris y', 'request iris position',
+             'manual iris volume')
+
+# Control commands that make other parameters change by themselves.
+AFFECTS = {
+    'pan speed': ('pan/tilt position',),
+    'tilt speed': ('pan/tilt position',),
+    'pan/tilt position': ('pan/tilt position',),
+    'zoom speed': ('zoom position x', 'zoom position y',
+                   'request zoom position'),
+    'zoom position x': ('zoom position y', 'request zoom position'),
+    'focus speed': ('focus position x', 'focus position y',
+                    'request focus position'),
+    'focus position y': ('request focus position',),
+    'extender/af': ('focus position x', 'focus position y',
+                    'request focus position'),
+    'iris': ('iris x', 'iris y', 'request iris position',
+             'manual iris volume'),
+    'iris auto/manual': ('iris x', 'iris y', 'request iris position',
+                         'manual iris volume'),
+    'recall preset memory': POSITIONS,
+}
+
+
+class StateCache(object):
+  """Last known value of each parameter, keyed by CameraFrame.
+
+  Values are the argument tuples of decoded replies, or of control commands
+  as they are sent. Entries are kept per frame, not per desc, as a few
+  descs name more than one command (say, both 'iris auto/manual' frames).
+  Entries expire after ttl seconds, positions after position_ttl as they
+  drift whenever the head moves. Sending a command listed in AFFECTS drops
+  the values it will change, and recalling a scene file drops everything.
+  """
+
+  def __init__(self, ttl=60.0, position_ttl=1.0, clock=time.monotonic):
+    self.ttl = ttl
+    self.position_ttl = position_ttl
+    self.clock = clock
+    self.hits = 0
+    self.misses = 0
+    self._entries = {}
+
+  def __len__(self):
+    return len(self._entries)
+
+  def __contains__(self, frame):
+    return self.Get(frame, count=False) is not None
+
+  def Update(self, frame, args):
+    """Record args as the current value of frame, e.g. from a reply."""
+    self._entries[frame] = (tuple(args), self.clock())
+
+  def OnControl(self, frame, args):
+    """Record a control command being sent to the camera.
+
+    Positions are only forgotten, as the head takes a while to get to the
+    one asked for, and so are values whose reply is shaped differently
+    from the command.
+    """
+    desc = frame.desc
+    if desc == 'scene file':
+      self._entries.clear()
+    self._Forget(AFFECTS.get(desc, ()))
+    if desc in POSITIONS or (frame.reply_format and
+                             frame.Widths('control') != frame.Widths('reply')):
+      self._entries.pop(frame, None)
+      return
+    self.Update(frame, args)
+
+  def OnControlReply(self, frame, args):
+    """Record the reply to a control command.
+
+    Replies to position commands echo the position asked for rather than
+    where the head is, so they are not recorded.
+    """
+    if frame.desc not in POSITIONS:
+      self.Update(frame, args)
+
+  def _Forget(self, descs):
+    for frame in [frame for frame in self._entries if frame.desc in descs]:
+      del self._entries[frame]
+
+  def Get(self, frame, max_age=None, count=True):
+    """Return the cached arguments for frame, or None if unknown or stale."""
+    entry = self._entries.get(frame)
+    if entry is not None:
+      args, stamp = entry
+      if max_age is None:
+        max_age = self.position_ttl if frame.desc in POSITIONS else self.ttl
+      if self.clock() - stamp <= max_age:
+        if count:
+          self.hits += 1
+        return args
+      del self._entries[frame]
+    if count:
+      self.misses += 1
+    return None
+
+  def Age(self, frame):
+    """Return how many seconds ago frame was updated, or None."""
+    entry = self._entries.get(frame)
+    if entry is None:
+      return None
+    return self.clock() - entry[1]
+
+  def Invalidate(self, frame=None):
+    """Forget frame, or everything if frame is None."""
+    if frame is None:
+      self._entries.clear()
+    else:
+      self._entries.pop(frame, None)
@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+"""Stream of pan/tilt, zoom, focus and iris positions from several cameras.
+
+Usage: telemetry.py <tty> [<tty> ...]
+"""
+
+import asyncio
+import collections
+import sys
+import time
+
+import he100client
+from scheduler import SPEEDS, STOP, Classify
+from statecache import AFFECTS
+
+POLLED = ('pan/tilt position', 'request zoom position',
+          'request focus position', 'request iris position')
+
+Sample = collections.namedtuple('Sample', 'camera desc args time')
+
+
+class _Position(object):
+  """Polling state of one position query on one camera."""
+
+  def __init__(self, frame, baudrate):
+    self.frame = frame
+    self.data = frame.EncodeConfirmationBytes()
+    # Link time of the query and its reply (10 bits per byte).
+    self.cost = (len(self.data) + frame.Size()) * 10.0 / baudrate
+    self.speeds = {}
+    self.settle_until = 0.0
+    self.due = 0.0
+    self.args = None
+
+  def Moving(self, now):
+    return now < self.settle_until or any(
+        speed != STOP for speed in self.speeds.values())
+
+
+class Telemetry(object):
+  """Polls camera positions, fast while they move and slowly otherwise.
+
+  clients is a dict of camera name to HE100Client. A position counts as
+  moving while a speed command that drives it (pan/tilt/zoom/focus speed)
+  is other than stop, and for settle seconds after any command listed in
+  statecache.AFFECTS for it, or after a sample that differs from the one
+  before, so preset recalls and moves made by other controllers are
+  followed too. Moving positions are polled every fast seconds, the others
+  every idle seconds, and all intervals of a camera are stretched evenly
+  when its polls would take more than budget of its link time.
+
+  Every sample goes to the listeners added with AddListener(), is kept in
+  latest and appended to history, a ring of the last history_size samples.
+  Polling of a camera whose link is lost stops, and the error is kept in
+  failed under its name.
+  """
+
+  def __init__(self, clients, fast=0.1, idle=2.0, settle=1.0, budget=0.25,
+               history_size=4096):
+    self.clients = clients
+    self.fast = fast
+    self.idle = idle
+    self.settle = settle
+    self.budget = budget
+    self.latest = {}
+    self.history = collections.deque(maxlen=history_size)
+    self.polls = 0
+    self.failed = {}
+    self._listeners = []
+    self._positions = {}
+    self._control_listeners = {}
+    self._wakeups = {}
+    self._tasks = []
+    for name, client in clients.items():
+      baudrate = client.transport.get_extra_info('baudrate') or 9600
+      self._positions[name] = dict(
+          (desc, _Position(client.camera.Find(desc, 'confirm'), baudrate))
+          for desc in POLLED)
+      listener = self._control_listeners[name] = (
+          lambda frame, args, name=name: self._Controlled(name, frame, args))
+      client.AddControlListener(listener)
+      self._wakeups[name] = asyncio.Event()
+      self._tasks.append(asyncio.ensure_future(self._Poll(name)))
+
+  def AddListener(self, callback):
+    """Call callback(sample) for every sample taken."""
+    self._listeners.append(callback)
+
+  def RemoveListener(self, callback):
+    self._listeners.remove(callback)
+
+  def History(self, camera=None, desc=None, since=None):
+    """Return the samples kept, of one camera and position if given."""
+    return [sample for sample in self.history
+            if (camera is None or sample.camera == camera) and
+            (desc is None or sample.desc == desc) and
+            (since is None or sample.time >= since)]
+
+  def Close(self):
+    for task in self._tasks:
+      task.cancel()
+    self._tasks = []
+    for name, client in self.clients.items():
+      client.RemoveControlListener(self._control_listeners.pop(name))
+
+  def _Controlled(self, name, frame, args):
+    now = time.monotonic()
+    woken = False
+    for desc in AFFECTS.get(frame.desc, ()):
+      position = self._positions[name].get(desc)
+      if position is None:
+        continue
+      if frame.desc in SPEEDS:
+        position.speeds[frame.desc] = Classify(frame, args)
+      position.settle_until = max(position.settle_until, now + self.settle)
+      if position.due > now + self.fast:
+        position.due = now
+        woken = True
+    if woken:
+      self._wakeups[name].set()
+
+  def _Interval(self, positions, now):
+    """Return the poll interval of each position, within the budget."""
+    intervals = dict((desc, self.fast if position.Moving(now) else self.idle)
+                     for desc, position in positions.items())
+    load = sum(position.cost / intervals[desc]
+               for desc, position in positions.items())
+    if load > self.budget:
+      stretch = load / self.budget
+      for desc in intervals:
+        intervals[desc] *= stretch
+    return intervals
+
+  async def _Poll(self, name):
+    client = self.clients[name]
+    positions = self._positions[name]
+    wakeup = self._wakeups[name]
+    while True:
+      desc, position = min(positions.items(), key=lambda item: item[1].due)
+      delay = position.due - time.monotonic()
+      if delay > 0:
+        wakeup.clear()
+        try:
+          await asyncio.wait_for(wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+          pass
+        continue
+
+      try:
+        args = await client.Send(position.frame, position.data)
+      except (he100client.CameraError, asyncio.TimeoutError):
+        args = None
+      except ConnectionError as exc:
+        self.failed[name] = exc
+        return
+      now = time.monotonic()
+      self.polls += 1
+      if args is not None:
+        # Drop the checksum group of replies that have one.
+        args = tuple(args[:len(position.frame.Widths())])
+        self._Publish(name, desc, position, args, now)
+      position.due = now + self._Interval(positions, now)[desc]
+
+  def _Publish(self, name, desc, position, args, now):
+    if position.args is not None and args != position.args:
+      position.settle_until = now + self.settle
+    position.args = args
+    sample = Sample(name, desc, args, now)
+    self.latest[name, desc] = sample
+    self.history.append(sample)
+    for listener in list(self._listeners):
+      listener(sample)
+
+
+async def _Main(tty_names):
+  clients = {}
+  for tty_name in tty_names:
+    clients[tty_name] = await he100client.Connect(tty_name)
+  telemetry = Telemetry(clients)
+  telemetry.AddListener(lambda sample: print('%.3f %s %s %s' % (
+      sample.time, sample.camera, sample.desc, ' '.join(sample.args))))
+  try:
+    await asyncio.Event().wait()
+  finally:
+    telemetry.Close()
+    for client in clients.values():
+      client.Close()
+
+
+def main():
+  if len(sys.argv) < 2:
+    print(__doc__.strip())
+    sys.exit(1)
+  try:
+    asyncio.run(_Main(sys.argv[1:]))
+  except KeyboardInterrupt:
+    pass
+
+
+if __name__ == '__main__':
+  main()
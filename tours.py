@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+"""Preset tours over several cameras, paced by their completion notices.
+
+Usage: tours.py <preset>[,<preset>...] <dwell seconds> <tty> [<tty> ...]
+"""
+
+import asyncio
+import collections
+import sys
+import time
+
+import he100client
+
+Arrival = collections.namedtuple('Arrival',
+                                 'step camera preset elapsed arrived error')
+
+
+class Step(object):
+  """Recall presets, then dwell seconds once there.
+
+  presets is a preset number for every camera or a dict of camera name to
+  preset number; cameras left out stay where they are. speed, if given, is
+  the preset speed setting (#RT) to use for the move. A camera that sends
+  no completion notice within timeout seconds is taken to have arrived.
+  """
+
+  def __init__(self, presets, dwell=0.0, speed=None, timeout=10.0):
+    self.presets = presets
+    self.dwell = dwell
+    self.speed = speed
+    self.timeout = timeout
+
+  def PresetFor(self, name):
+    if isinstance(self.presets, dict):
+      return self.presets.get(name)
+    return self.presets
+
+
+class Tour(object):
+  """Runs Steps on a dict of camera name to HE100Client.
+
+  Each recall is followed by waiting for that camera's preset complete
+  notification (q) rather than a fixed time, so short moves finish early
+  and moves on different cameras overlap. With sync, every camera finishes
+  a step before any starts the next; without, each camera goes through the
+  steps at its own pace. arrivals logs how long each move took and whether
+  it was confirmed or timed out. A camera that refuses a command or whose
+  link fails gets an arrival with the error, and the others carry on.
+  """
+
+  def __init__(self, clients):
+    self.clients = clients
+    self.arrivals = []
+    self._speeds = {}
+    self._waiting = {}
+    self._listeners = {}
+    for name, client in clients.items():
+      listener = self._listeners[name] = (
+          lambda frame, args, name=name: self._Notified(name, frame, args))
+      client.AddListener(listener)
+
+  def Close(self):
+    for name, client in self.clients.items():
+      client.RemoveListener(self._listeners.pop(name))
+
+  def _Notified(self, name, frame, args):
+    if frame.desc != 'preset complete notification':
+      return
+    waiter = self._waiting.get((name, args[0]))
+    if waiter is not None and not waiter.done():
+      waiter.set_result(None)
+
+  async def Run(self, steps, loops=1, sync=True):
+    steps = list(steps) * loops
+    if sync:
+      for index, step in enumerate(steps):
+        await asyncio.gather(*[self._Visit(name, index, step)
+                               for name in self.clients])
+        await asyncio.sleep(step.dwell)
+    else:
+      await asyncio.gather(*[self._Follow(name, steps)
+                             for name in self.clients])
+
+  async def _Follow(self, name, steps):
+    for index, step in enumerate(steps):
+      if await self._Visit(name, index, step):
+        await asyncio.sleep(step.dwell)
+
+  async def _Visit(self, name, index, step):
+    """Move one camera to its preset for step; returns False if it has none."""
+    preset = step.PresetFor(name)
+    if preset is None:
+      return False
+    client = self.clients[name]
+    if step.speed is not None and self._speeds.get(name) != step.speed:
+      try:
+        await client.Control('preset mode', str(step.speed))
+      except (he100client.CameraError, ConnectionError,
+              asyncio.TimeoutError) as exc:
+        self.arrivals.append(Arrival(index, name, '%02d' % (preset,), 0.0,
+                                     False, exc))
+        return True
+      self._speeds[name] = step.speed
+
+    preset = '%02d' % (preset,)
+    key = (name, preset)
+    waiter = self._waiting[key] = asyncio.get_running_loop().create_future()
+    start = time.monotonic()
+    arrived, error = False, None
+    try:
+      await client.Control('recall preset memory', preset)
+      await asyncio.wait_for(waiter, step.timeout)
+      arrived = True
+    except asyncio.TimeoutError:
+      pass
+    except (he100client.CameraError, ConnectionError) as exc:
+      error = exc
+    finally:
+      if self._waiting.get(key) is waiter:
+        del self._waiting[key]
+    self.arrivals.append(Arrival(index, name, preset,
+                                 time.monotonic() - start, arrived, error))
+    return True
+
+
+async def _Main(presets, dwell, tty_names):
+  clients = {}
+  for tty_name in tty_names:
+    clients[tty_name] = await he100client.Connect(tty_name)
+  tour = Tour(clients)
+  try:
+    await tour.Run([Step(preset, dwell) for preset in presets])
+    for arrival in tour.arrivals:
+      if arrival.error is not None:
+        outcome = ' (failed: %s)' % (arrival.error,)
+      elif not arrival.arrived:
+        outcome = ' (timed out)'
+      else:
+        outcome = ''
+      print('%d %s preset %s: %.2fs%s' % (
+          arrival.step, arrival.camera, arrival.preset, arrival.elapsed,
+          outcome))
+  finally:
+    tour.Close()
+    for client in clients.values():
+      client.Close()
+
+
+def main():
+  if len(sys.argv) < 4:
+    print(__doc__.strip())
+    sys.exit(1)
+  presets = [int(preset) for preset in sys.argv[1].split(',')]
+  asyncio.run(_Main(presets, float(sys.argv[2]), sys.argv[3:]))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+"""Precomputed camera paths played back on a drift free schedule.
+
+A path is an (N, 3) array of pan, tilt and zoom values in -1..1, one row per
+step. Speed paths map 0 to stop (50) and +-1 to full speed (99/01). Position
+paths map -1..1 onto the pan, tilt and zoom ranges of the head. Paths are
+encoded to complete frames up front, so playback only writes bytes.
+"""
+
+import time
+
+import numpy
+
+from he100 import HE100
+
+PAN_RANGE = (0x2D09, 0xD2F5)
+TILT_RANGE = (0x5555, 0x8E38)
+ZOOM_RANGE = (0x555, 0xFFF)
+
+SPEED_COMMANDS = ('#P', '#T', '#Z')
+
+
+def _Angles(steps):
+  return numpy.arange(steps) * (2 * numpy.pi / steps)
+
+
+def _Path(pan, tilt, zoom=0.0):
+  pan = numpy.asarray(pan, dtype=float)
+  path = numpy.zeros((len(pan), 3))
+  path[:, 0] = pan
+  path[:, 1] = tilt
+  path[:, 2] = zoom
+  return path
+
+
+def Circle(steps, radius=1.0):
+  """One full turn of a circle of the given radius, in steps steps."""
+  angles = _Angles(steps)
+  return _Path(radius * numpy.sin(angles), radius * numpy.cos(angles))
+
+
+def FigureEight(steps, radius=1.0):
+  """A figure of eight lying on its side, in steps steps."""
+  angles = _Angles(steps)
+  return _Path(radius * numpy.sin(angles),
+               radius * numpy.sin(2 * angles) / 2)
+
+
+def Line(start, end, steps):
+  """A straight line from start to end (pan, tilt, zoom), both included."""
+  fractions = numpy.linspace(0.0, 1.0, steps)[:, numpy.newaxis]
+  start = numpy.asarray(start, dtype=float)
+  end = numpy.asarray(end, dtype=float)
+  return start + (end - start) * fractions
+
+
+def Spline(waypoints, steps):
+  """A Catmull-Rom spline through the (pan, tilt, zoom) waypoints."""
+  points = numpy.asarray(waypoints, dtype=float)
+  if len(points) < 2:
+    raise ValueError('A spline needs at least two waypoints')
+  # Repeat the end points so the curve passes through every waypoint.
+  padded = numpy.vstack((points[:1], points, points[-1:]))
+  position = numpy.linspace(0.0, len(points) - 1, steps)
+  segment = numpy.minimum(position.astype(int), len(points) - 2)
+  t = (position - segment)[:, numpy.newaxis]
+  p0 = padded[segment]
+  p1 = padded[segment + 1]
+  p2 = padded[segment + 2]
+  p3 = padded[segment + 3]
+  return 0.5 * (2 * p1 + (p2 - p0) * t +
+                (2 * p0 - 5 * p1 + 4 * p2 - p3) * t ** 2 +
+                (3 * p1 - p0 - 3 * p2 + p3) * t ** 3)
+
+
+def Speeds(path):
+  """Return the 01..99 speed steps of a speed path as an int array."""
+  speeds = numpy.rint(50 + 49 * numpy.asarray(path))
+  return numpy.clip(speeds, 1, 99).astype(int)
+
+
+def EncodeSpeeds(path, commands=SPEED_COMMANDS):
+  """Return one bytes object per step with the speed frames for that step.
+
+  Only axes whose speed differs from the previous step are sent, so a step
+  may encode to b''.
+  """
+  speeds = Speeds(path)
+  previous = numpy.vstack((numpy.full((1, speeds.shape[1]), -1), speeds[:-1]))
+  steps = []
+  for row, changed in zip(speeds.tolist(), (speeds != previous).tolist()):
+    steps.append(b''.join([b'%s%02d\r' % (command.encode('latin-1'), value)
+                           for command, value, send
+                           in zip(commands, row, changed) if send]))
+  return steps
+
+
+def Positions(path):
+  """Return the absolute pan, tilt and zoom values of a position path."""
+  path = numpy.clip(numpy.asarray(path, dtype=float), -1, 1)
+  positions = numpy.empty(path.shape, dtype=int)
+  for column, (low, high) in enumerate((PAN_RANGE, TILT_RANGE, ZOOM_RANGE)):
+    positions[:, column] = numpy.rint(
+        numpy.interp(path[:, column], (-1, 1), (low, high)))
+  return positions
+
+
+def EncodePositions(path, camera=HE100):
+  """Return one bytes object per step with #U pan/tilt and #AXZ zoom frames."""
+  pan_tilt = camera.Find('pan/tilt position', 'control')
+  zoom = camera.Find('zoom position x', 'control')
+  steps = []
+  for pan, tilt, zoom_value in Positions(path).tolist():
+    buf = bytearray()
+    pan_tilt.EncodeControlInto(buf, (b'%04X' % pan, b'%04X' % tilt))
+    zoom.EncodeControlInto(buf, b'%03X' % zoom_value)
+    steps.append(bytes(buf))
+  return steps
+
+
+class Player(object):
+  """Writes precomputed steps to a port, one every period seconds.
+
+  Step n is due at start + n * period on the monotonic clock, so the time
+  spent writing never accumulates into drift. late counts steps written more
+  than a period after they were due and max_lateness holds the worst delay.
+  With skip_late, such steps are dropped instead, which suits position paths
+  where only the latest target matters.
+  """
+
+  def __init__(self, port, period=0.1, skip_late=False, clock=time.monotonic,
+               sleep=time.sleep):
+    self.port = port
+    self.period = period
+    self.skip_late = skip_late
+    self.clock = clock
+    self.sleep = sleep
+    self.late = 0
+    self.max_lateness = 0.0
+
+  def Play(self, steps, loops=1):
+    start = self.clock()
+    count = len(steps)
+    for index in range(count * loops):
+      deadline = start + index * self.period
+      delay = deadline - self.clock()
+      if delay > 0:
+        self.sleep(delay)
+      elif -delay > self.period:
+        self.late += 1
+        self.max_lateness = max(self.max_lateness, -delay)
+        if self.skip_late:
+          continue
+      data = steps[index % count]
+      if data:
+        self.port.WriteFrame(data)
+
+  def Stop(self, commands=SPEED_COMMANDS):
+    """Send stop on every speed axis and wait for it to leave the port."""
+    self.port.WriteFrames(['%s50\r' % command for command in commands],
+                          drain=True)